@@ -1,7 +1,16 @@
 import os
+import re
 import sqlite3
 import io
+import time
+import random
+import threading
+import csv
+import json
+import zlib
 from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
+import click
 from flask import (
     Flask,
     render_template,
@@ -13,13 +22,24 @@ from flask import (
     g,
     jsonify,
     Response,
+    stream_with_context,
+    send_file,
+    send_from_directory,
+    template_rendered,
+    before_render_template,
 )
 from dotenv import load_dotenv
 
+import backups
+import profiler
+from storage import crear_storage, ERRORES_INTEGRIDAD
+
 load_dotenv()
 
 ADMIN_KEY = os.getenv("ADMIN_KEY", "cambiame-por-una-clave-secreta")
 DB_PATH = os.getenv("DB_PATH", "/data/rsvps.db")
+# SQLite en DB_PATH, o Postgres si hay DATABASE_URL (ver storage.py)
+storage = crear_storage(DB_PATH)
 ADMIN_BASE_URL = os.getenv("ADMIN_BASE_URL", "https://juliymarian.fly.dev/admin")
 
 app = Flask(__name__)
@@ -31,11 +51,22 @@ app.config["ADMIN_KEY"] = ADMIN_KEY
 
 def get_db():
     if "db" not in g:
-        g.db = sqlite3.connect(DB_PATH)
-        g.db.row_factory = sqlite3.Row
+        g.db = storage.conectar()
+        if g.get("perfil") is not None:
+            g.db = profiler.ConexionMedida(g.db, g.perfil)
     return g.db
 
 
+def stream_db(sql, params=(), chunk=500):
+    """storage.stream() con la consulta medida si el request se perfila."""
+    # stream() abre su propia conexión, así que no pasa por get_db()
+    perfil = g.get("perfil")
+    envolver = None
+    if perfil is not None:
+        envolver = lambda cur: profiler.CursorMedido(cur, perfil, sql)
+    return storage.stream(sql, params, chunk, envolver)
+
+
 @app.teardown_appcontext
 def close_db(_exc):
     db = g.pop("db", None)
@@ -43,47 +74,300 @@ def close_db(_exc):
         db.close()
 
 
+_schema_listo = False
+
+
 def init_db():
+    # Una vez por proceso: en Postgres no queremos DDL en cada request
+    global _schema_listo
+    if _schema_listo:
+        return
     db = get_db()
-    db.execute(
+    storage.init_schema(db)
+    rollup_backfill_inicial(db)
+    _schema_listo = True
+
+
+# ---------- Profiler a pedido ----------
+
+# Se activa con ?profile=1 junto con la clave de admin, o al azar para una
+# fracción de los requests con PROFILE_SAMPLE_RATE (ej. 0.01).
+PROFILE_DIR = os.getenv(
+    "PROFILE_DIR", os.path.join(os.path.dirname(DB_PATH) or ".", "profiles")
+)
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "2"))
+PROFILE_MAX = int(os.getenv("PROFILE_MAX", "50"))
+
+
+def _quiere_perfil() -> bool:
+    if request.endpoint in (None, "static") or request.path.startswith(
+        "/admin/profiles"
+    ):
+        return False
+    if request.args.get("profile") == "1":
+        key = request.args.get("key") or request.form.get("key") or ""
+        return key == ADMIN_KEY
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+@app.before_request
+def empezar_perfil():
+    if not _quiere_perfil():
+        return None
+    g.perfil = profiler.Perfil(
+        request.method, request.path, PROFILE_INTERVAL_MS / 1000
+    )
+    g.perfil.empezar()
+    return None
+
+
+@app.teardown_request
+def terminar_perfil(_exc):
+    perfil = g.pop("perfil", None)
+    if perfil is None:
+        return
+    perfil.terminar()
+    try:
+        profiler.guardar(perfil, PROFILE_DIR, PROFILE_MAX)
+    except OSError as e:
+        print("ERROR guardando profile:", e)
+
+
+@before_render_template.connect_via(app)
+def _perfil_template_empieza(_app, template, context, **_kw):
+    perfil = g.get("perfil")
+    if perfil is not None:
+        perfil.template_empieza(template.name)
+
+
+@template_rendered.connect_via(app)
+def _perfil_template_termina(_app, template, context, **_kw):
+    perfil = g.get("perfil")
+    if perfil is not None:
+        perfil.template_termina(template.name)
+
+
+# ---------- Límite de pedidos (token bucket por IP y ruta) ----------
+
+# Los buckets viven en un SQLite aparte, local a la máquina, así los
+# workers de gunicorn comparten los contadores sin pisar la base principal.
+RATE_DB_PATH = os.getenv("RATE_DB_PATH", "/tmp/ratelimit.db")
+
+# endpoint -> (capacidad del bucket, tokens que se recuperan por segundo)
+RATE_LIMITS = {
+    "enviar_rsvp": (
+        int(os.getenv("RATE_ENVIAR_BURST", "5")),
+        float(os.getenv("RATE_ENVIAR_POR_MIN", "5")) / 60,
+    ),
+    "api_invitados": (
+        int(os.getenv("RATE_API_BURST", "20")),
+        float(os.getenv("RATE_API_POR_SEG", "2")),
+    ),
+}
+
+# Descarte por sobrecarga (503). Con workers sync de gunicorn, lo que crece
+# cuando no damos abasto es la cola de conexiones esperando un worker:
+#  - SHED_MAX_COLA: conexiones en la cola de accept del puerto (se lee de
+#    /proc/net/tcp). Por defecto, tantas como workers: más que eso es que
+#    cada worker ya tiene otro pedido esperando atrás.
+#  - SHED_MAX_ESPERA_MS: cuánto esperó el pedido antes de empezar, si el
+#    proxy manda la hora de llegada (SHED_HEADER_INICIO, ej. "t=<ms>").
+# 0 desactiva cada uno.
+SHED_PUERTO = int(os.getenv("PORT", "8080"))
+SHED_MAX_COLA = int(
+    os.getenv("SHED_MAX_COLA", os.getenv("WEB_CONCURRENCY", "2"))
+)
+SHED_MAX_ESPERA_MS = float(os.getenv("SHED_MAX_ESPERA_MS", "1000"))
+SHED_HEADER_INICIO = os.getenv("SHED_HEADER_INICIO", "X-Request-Start")
+
+_rate_local = threading.local()
+
+
+def get_rate_db():
+    con = getattr(_rate_local, "con", None)
+    if con is None:
+        con = sqlite3.connect(RATE_DB_PATH, timeout=1, isolation_level=None)
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute("PRAGMA synchronous=OFF")
+        con.execute(
+            """
+            CREATE TABLE IF NOT EXISTS buckets (
+                clave TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                ts REAL NOT NULL
+            )
         """
-        CREATE TABLE IF NOT EXISTS rsvps (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            nombre TEXT NOT NULL,
-            confirma INTEGER NOT NULL,
-            menu TEXT,
-            mensaje TEXT,
-            created_at TEXT NOT NULL
         )
-    """
-    )
-    db.execute(
+        con.execute(
+            """
+            CREATE TABLE IF NOT EXISTS contadores (
+                nombre TEXT PRIMARY KEY,
+                valor INTEGER NOT NULL
+            )
         """
-        CREATE TABLE IF NOT EXISTS invitados (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            nombre TEXT UNIQUE NOT NULL
         )
-    """
-    )
-    # --- TABLA GASTOS ---
-    db.execute(
+        _rate_local.con = con
+    return con
+
+
+def client_ip() -> str:
+    # Fly pone la IP real en Fly-Client-IP. Si no está, la última entrada
+    # de X-Forwarded-For es la que agregó el proxy: las anteriores las manda
+    # el cliente y cambiándolas tendría un bucket nuevo en cada pedido.
+    ip = request.headers.get("Fly-Client-IP")
+    if not ip:
+        ip = (request.headers.get("X-Forwarded-For") or "").split(",")[-1]
+    return ip.strip() or (request.remote_addr or "?")
+
+
+def _sumar(con, nombre: str):
+    con.execute(
         """
-        CREATE TABLE IF NOT EXISTS gastos (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            concepto TEXT NOT NULL,
-            tipo TEXT NOT NULL CHECK(tipo IN ('por_invitado', 'total')),
-            monto REAL NOT NULL,
-            notas TEXT,
-            created_at TEXT NOT NULL
+        INSERT INTO contadores (nombre, valor) VALUES (?, 1)
+        ON CONFLICT(nombre) DO UPDATE SET valor = valor + 1
+        """,
+        (nombre,),
+    )
+
+
+def tomar_token(clave: str, capacidad: int, por_seg: float) -> float:
+    """
+    Descuenta un token del bucket. Devuelve 0 si pasó, o los segundos
+    a esperar hasta que haya uno.
+    """
+    con = get_rate_db()
+    ahora = time.time()
+    con.execute("BEGIN IMMEDIATE")
+    try:
+        row = con.execute(
+            "SELECT tokens, ts FROM buckets WHERE clave = ?", (clave,)
+        ).fetchone()
+        tokens = (
+            capacidad
+            if row is None
+            else min(capacidad, row[0] + (ahora - row[1]) * por_seg)
+        )
+        espera = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            espera = (1 - tokens) / por_seg
+        con.execute(
+            """
+            INSERT INTO buckets (clave, tokens, ts) VALUES (?, ?, ?)
+            ON CONFLICT(clave) DO UPDATE SET tokens = excluded.tokens,
+                                             ts = excluded.ts
+            """,
+            (clave, tokens, ahora),
         )
+        if random.random() < 0.01:
+            con.execute("DELETE FROM buckets WHERE ts < ?", (ahora - 3600,))
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    return espera
+
+
+def cola_accept(puerto: int = SHED_PUERTO) -> int | None:
     """
-    )
-    db.commit()
+    Conexiones esperando en la cola de accept del socket que escucha en
+    `puerto` (la comparten todos los workers). None si no se puede saber
+    (no es Linux, o no hay nada escuchando ahí).
+    """
+    hex_puerto = f":{puerto:04X}"
+    total, encontrado = 0, False
+    for archivo in ("/proc/net/tcp", "/proc/net/tcp6"):
+        try:
+            with open(archivo) as f:
+                next(f)  # encabezado
+                for linea in f:
+                    campos = linea.split()
+                    # estado 0A = LISTEN; en LISTEN, rx_queue es la cola de accept
+                    if campos[1].endswith(hex_puerto) and campos[3] == "0A":
+                        total += int(campos[4].split(":")[1], 16)
+                        encontrado = True
+        except OSError:
+            continue
+    return total if encontrado else None
+
+
+def espera_previa_ms(valor: str | None) -> float | None:
+    """
+    Cuánto esperó el pedido antes de llegar al worker, según la hora de
+    llegada que anota el proxy ("t=1700000000123", en s, ms o µs).
+    """
+    if not valor:
+        return None
+    try:
+        t = float(valor.strip().removeprefix("t="))
+    except ValueError:
+        return None
+    if t > 1e14:
+        t /= 1e6  # µs
+    elif t > 1e11:
+        t /= 1e3  # ms
+    # relojes desfasados entre proxy y máquina: nunca negativo
+    return max(0.0, (time.time() - t) * 1000)
+
+
+def sobrecargado() -> str | None:
+    """Motivo para descartar el pedido, o None si hay que atenderlo."""
+    if SHED_MAX_ESPERA_MS:
+        espera = espera_previa_ms(request.headers.get(SHED_HEADER_INICIO))
+        if espera is not None and espera >= SHED_MAX_ESPERA_MS:
+            return "espera"
+    if SHED_MAX_COLA:
+        cola = cola_accept()
+        if cola is not None and cola >= SHED_MAX_COLA:
+            return "cola"
+    return None
+
+
+def _demasiados(mensaje: str, status: int, espera: float):
+    if request.path.startswith("/api/"):
+        resp = jsonify({"ok": False, "error": mensaje})
+    else:
+        resp = Response(mensaje, mimetype="text/plain; charset=utf-8")
+    resp.status_code = status
+    resp.headers["Retry-After"] = str(max(1, int(espera + 0.999)))
+    return resp
+
+
+@app.before_request
+def limitar_pedidos():
+    limite = RATE_LIMITS.get(request.endpoint)
+    if limite is None:
+        return None
+
+    try:
+        con = get_rate_db()
+        motivo = sobrecargado()
+        if motivo:
+            _sumar(con, f"descartados:{motivo}")
+            return _demasiados(
+                "El servidor está ocupado, probá en unos segundos.", 503, 1
+            )
+
+        espera = tomar_token(f"{request.endpoint}|{client_ip()}", *limite)
+        if espera:
+            _sumar(con, f"limitados:{request.endpoint}")
+            return _demasiados(
+                "Demasiados pedidos, esperá un momento.", 429, espera
+            )
+
+        _sumar(con, f"admitidos:{request.endpoint}")
+    except sqlite3.Error as e:
+        # Si el limitador falla, dejamos pasar: mejor eso que tirar la app
+        print("ERROR en limitador:", e)
+    return None
 
 
 @app.before_request
 def ensure_db():
     init_db()
+    iniciar_backups_periodicos()
 
 
 def admin_redirect():
@@ -121,9 +405,36 @@ def rsvp_form():
     return render_template("rsvp.html")
 
 
+RE_IDEMPOTENCIA = re.compile(r"^[A-Za-z0-9_-]{8,64}$")
+
+
+def hora_local(valor: str | None) -> str | None:
+    """
+    Una fecha ISO que manda el cliente (con o sin zona, o sólo el día)
+    pasada a la hora local del server, como se guardan created_at y
+    updated_at. None si no vino o no se entiende.
+    """
+    try:
+        dt = datetime.fromisoformat((valor or "").strip())
+    except ValueError:
+        return None
+    if dt.tzinfo is not None:
+        dt = dt.astimezone().replace(tzinfo=None)
+    return dt.isoformat(timespec="seconds")
+
+
 @app.post("/enviar")
 def enviar_rsvp():
+    # Los reenvíos del service worker (confirmaciones hechas sin conexión)
+    # piden JSON y traen una clave de idempotencia para no duplicarse.
+    quiere_json = request.accept_mimetypes.best == "application/json"
     try:
+        clave = (request.form.get("idempotency_key") or "").strip()
+        if clave and not RE_IDEMPOTENCIA.match(clave):
+            clave = ""
+        # cuándo se llenó, si viene de la cola sin conexión
+        guardado = hora_local(request.form.get("guardado"))
+
         nombre = (request.form.get("nombre") or "").strip()
         confirma_val = (request.form.get("confirma") or "").strip().lower()
         raw_menu = (
@@ -153,6 +464,8 @@ def enviar_rsvp():
             )
 
         if errors:
+            if quiere_json:
+                return jsonify({"ok": False, "errors": errors}), 400
             for e in errors:
                 flash(e, "danger")
             # Volver a la landing, sección confirmar
@@ -160,7 +473,42 @@ def enviar_rsvp():
 
         confirma = 1 if confirma_val == "si" else 0
         menu_to_save = menu if confirma == 1 else None
-
+        ahora = datetime.now().isoformat(timespec="seconds")
+
+        # antes de leer el historial para los rollups (ver bloquear_rsvps)
+        storage.bloquear_rsvps(db)
+        if clave:
+            nueva = db.execute(
+                """
+                INSERT INTO rsvp_idempotencia (clave, created_at)
+                VALUES (?, ?)
+                ON CONFLICT DO NOTHING
+                RETURNING clave
+                """,
+                (clave, ahora),
+            ).fetchone()
+            if not nueva:
+                # ya la habíamos guardado (reintento o doble click)
+                db.rollback()
+                if quiere_json:
+                    return jsonify({"ok": True, "duplicado": True})
+                return redirect(url_for("gracias"), code=303)
+
+        if guardado:
+            vigente = db.execute(
+                "SELECT MAX(created_at) AS mx FROM rsvps WHERE nombre = ?",
+                (nombre,),
+            ).fetchone()["mx"]
+            if vigente and vigente > guardado:
+                # Se llenó sin conexión antes de la respuesta que ya está
+                # guardada: es vieja y no la pisa. La clave queda anotada.
+                db.commit()
+                if quiere_json:
+                    return jsonify({"ok": True, "descartado": True})
+                return redirect(url_for("gracias"), code=303)
+
+        rollup_aplicar(db, [nombre], -1)
+        antes = rsvps_vigentes(db, [nombre])
         db.execute(
             """
             INSERT INTO rsvps (nombre, confirma, menu, mensaje, created_at)
@@ -171,15 +519,21 @@ def enviar_rsvp():
                 confirma,
                 menu_to_save,
                 (mensaje or None),
-                datetime.now().isoformat(timespec="seconds"),
+                ahora,
             ),
         )
+        rollup_aplicar(db, [nombre], 1)
+        marcar_rsvps_cambiados(db, [nombre], antes)
         db.commit()
 
+        if quiere_json:
+            return jsonify({"ok": True})
         return redirect(url_for("gracias"), code=303)
 
     except Exception as ex:
         print("ERROR en /enviar:", ex)
+        if quiere_json:
+            return jsonify({"ok": False, "error": "Error guardando."}), 500
         flash(
             "Ocurrió un error guardando tu confirmación. Probá de nuevo.",
             "danger",
@@ -192,10 +546,42 @@ def gracias():
     return render_template("gracias.html")
 
 
+@app.get("/sw.js")
+def service_worker():
+    # Servido desde la raíz para que el service worker controle todo el sitio
+    resp = send_from_directory(
+        app.static_folder, "sw.js", mimetype="application/javascript"
+    )
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
+
+
 # =========================
 # ===      ADMIN        ===
 # =========================
 
+def resumen_admin(db) -> dict:
+    row = db.execute(
+        """
+        SELECT
+          COALESCE(SUM(CASE WHEN confirma = 1 THEN 1 ELSE 0 END), 0)
+            AS total_si,
+          COALESCE(SUM(CASE WHEN confirma = 0 THEN 1 ELSE 0 END), 0)
+            AS total_no,
+          COALESCE(SUM(CASE WHEN confirma = 1
+                             AND LOWER(COALESCE(menu, '')) = 'standard'
+                            THEN 1 ELSE 0 END), 0)
+            AS total_standard,
+          COALESCE(SUM(CASE WHEN confirma = 1
+                             AND LOWER(COALESCE(menu, '')) IN ('veggie', 'vegano')
+                            THEN 1 ELSE 0 END), 0)
+            AS total_veggie
+        FROM rsvps
+        """
+    ).fetchone()
+    return dict(row)
+
+
 @app.get("/admin")
 def admin():
     key = request.args.get("key", "")
@@ -219,30 +605,17 @@ def admin():
         """
     ).fetchall()
 
-    total_si = sum(1 for r in rsvps if r["confirma"] == 1)
-    total_no = sum(1 for r in rsvps if r["confirma"] == 0)
-    total_standard = sum(
-        1
-        for r in rsvps
-        if r["confirma"] == 1
-        and (r["menu"] or "").lower() == "standard"
-    )
-    total_veggie = sum(
-        1
-        for r in rsvps
-        if r["confirma"] == 1
-        and (r["menu"] or "").lower() in {"veggie", "vegano"}
-    )
+    resumen = resumen_admin(db)
 
     return render_template(
         "admin.html",
         rsvps=rsvps,
         invitados=invitados,
         cant_invitados=len(invitados),
-        total_si=total_si,
-        total_no=total_no,
-        total_standard=total_standard,
-        total_veggie=total_veggie,
+        **resumen,
+        perfiles=profiler.listar(PROFILE_DIR)[:20],
+        backups_on=backups_habilitados(),
+        snapshots=backups.listar(BACKUP_DIR)[:20],
         key=key,
     )
 
@@ -268,7 +641,11 @@ def admin_cargar_invitados():
     for n in nombres:
         try:
             db.execute(
-                "INSERT OR IGNORE INTO invitados(nombre) VALUES (?)", (n,)
+                """
+                INSERT INTO invitados(nombre, updated_at) VALUES (?, ?)
+                ON CONFLICT DO NOTHING
+                """,
+                (n, datetime.now().isoformat(timespec="seconds")),
             )
         except Exception:
             pass
@@ -294,6 +671,7 @@ def admin_invitado_update():
 
     db = get_db()
     try:
+        storage.bloquear_rsvps(db)
         row_old = db.execute(
             "SELECT nombre FROM invitados WHERE id = ?", (inv_id,)
         ).fetchone()
@@ -303,19 +681,27 @@ def admin_invitado_update():
         viejo = row_old["nombre"]
 
         db.execute(
-            "UPDATE invitados SET nombre = ? WHERE id = ?",
-            (nuevo, inv_id),
+            "UPDATE invitados SET nombre = ?, updated_at = ? WHERE id = ?",
+            (nuevo, datetime.now().isoformat(timespec="seconds"), inv_id),
         )
 
         if cascade and viejo != nuevo:
+            rollup_aplicar(db, [viejo, nuevo], -1)
+            antes = rsvps_vigentes(db, [viejo, nuevo])
             db.execute(
                 "UPDATE rsvps SET nombre = ? WHERE nombre = ?",
                 (nuevo, viejo),
             )
+            db.execute(
+                "UPDATE rsvps_archivo SET nombre = ? WHERE nombre = ?",
+                (nuevo, viejo),
+            )
+            rollup_aplicar(db, [viejo, nuevo], 1)
+            marcar_rsvps_cambiados(db, [viejo, nuevo], antes)
 
         db.commit()
         flash("Invitado actualizado correctamente.", "success")
-    except sqlite3.IntegrityError:
+    except ERRORES_INTEGRIDAD:
         db.rollback()
         flash(
             "Ya existe un invitado con ese nombre.", "danger"
@@ -346,7 +732,7 @@ def api_invitados():
         LEFT JOIN rsvps r
                ON r.nombre = i.nombre
               AND r.created_at = ult.mx
-        WHERE i.nombre LIKE ?
+        WHERE LOWER(i.nombre) LIKE LOWER(?)
           AND (r.nombre IS NULL OR r.confirma <> 1)
         ORDER BY i.nombre
         LIMIT 5
@@ -382,6 +768,13 @@ def admin_rsvp_update():
         menu = None
 
     try:
+        storage.bloquear_rsvps(db)
+        previo = db.execute(
+            "SELECT nombre FROM rsvps WHERE id = ?", (rid,)
+        ).fetchone()
+        afectados = {nombre, previo["nombre"] if previo else None}
+        rollup_aplicar(db, afectados, -1)
+        antes = rsvps_vigentes(db, afectados)
         db.execute(
             """
             UPDATE rsvps
@@ -393,6 +786,8 @@ def admin_rsvp_update():
             """,
             (nombre, int(confirma), menu, mensaje, rid),
         )
+        rollup_aplicar(db, afectados, 1)
+        marcar_rsvps_cambiados(db, afectados, antes)
         db.commit()
         flash("RSVP actualizado correctamente.", "success")
     except Exception as e:
@@ -410,6 +805,7 @@ def admin_export_xlsx():
 
     try:
         from openpyxl import Workbook
+        from openpyxl.cell import WriteOnlyCell
         from openpyxl.styles import Font, Alignment
         from openpyxl.utils import get_column_letter
     except Exception:
@@ -419,86 +815,75 @@ def admin_export_xlsx():
             status=500,
         )
 
-    db = get_db()
-    try:
-        rows = db.execute(
-            """
-            SELECT i.nombre,
-                   r.confirma,
-                   r.menu,
-                   r.mensaje,
-                   r.created_at
-            FROM invitados i
-            LEFT JOIN (
-                SELECT nombre, confirma, menu, mensaje, created_at
-                FROM rsvps r1
-                WHERE r1.created_at = (
-                    SELECT MAX(r2.created_at)
-                    FROM rsvps r2
-                    WHERE r2.nombre = r1.nombre
-                )
-            ) r ON r.nombre = i.nombre
-            ORDER BY i.nombre
+    # Se recorre con stream_db() (cursor del lado del servidor en
+    # Postgres) y el libro va en modo write_only: ni el resultado ni las
+    # celdas quedan enteros en memoria.
+    filas = stream_db(
         """
-        ).fetchall()
-    except Exception as e:
-        return Response(
-            f"Error leyendo la base: {e}",
-            mimetype="text/plain; charset=utf-8",
-            status=500,
-        )
-
-    respondieron, faltan = [], []
-    for row in rows:
-        if row["created_at"]:
-            confirma_txt = "si" if row["confirma"] == 1 else "no"
-            respondieron.append(
-                [
-                    row["nombre"],
-                    confirma_txt,
-                    row["menu"] or "",
-                    row["mensaje"] or "",
-                    row["created_at"],
-                ]
+        SELECT i.nombre,
+               r.confirma,
+               r.menu,
+               r.mensaje,
+               r.created_at
+        FROM invitados i
+        LEFT JOIN (
+            SELECT nombre, confirma, menu, mensaje, created_at
+            FROM rsvps r1
+            WHERE r1.created_at = (
+                SELECT MAX(r2.created_at)
+                FROM rsvps r2
+                WHERE r2.nombre = r1.nombre
             )
-        else:
-            faltan.append([row["nombre"]])
+        ) r ON r.nombre = i.nombre
+        ORDER BY i.nombre
+        """
+    )
 
-    from openpyxl import Workbook
-    from openpyxl.styles import Font, Alignment
-    from openpyxl.utils import get_column_letter
+    wb = Workbook(write_only=True)
+    bold = Font(bold=True)
 
-    wb = Workbook()
+    def encabezado(ws, titulos):
+        celdas = []
+        for t in titulos:
+            c = WriteOnlyCell(ws, value=t)
+            c.font = bold
+            c.alignment = Alignment(vertical="center")
+            celdas.append(c)
+        ws.append(celdas)
 
-    ws1 = wb.active
-    ws1.title = "Respondieron"
-    headers1 = [
-        "nombre",
-        "confirma",
-        "menu",
-        "mensaje",
-        "fecha_ultima_respuesta",
-    ]
-    ws1.append(headers1)
-    for r in respondieron:
-        ws1.append(r)
-    bold = Font(bold=True)
-    for cell in ws1[1]:
-        cell.font = bold
-        cell.alignment = Alignment(vertical="center")
+    ws1 = wb.create_sheet(title="Respondieron")
     col_widths1 = [30, 10, 14, 50, 24]
     for idx, w in enumerate(col_widths1, start=1):
         ws1.column_dimensions[get_column_letter(idx)].width = w
+    encabezado(
+        ws1,
+        ["nombre", "confirma", "menu", "mensaje", "fecha_ultima_respuesta"],
+    )
 
     ws2 = wb.create_sheet(title="Faltan")
-    headers2 = ["nombre"]
-    ws2.append(headers2)
-    for r in faltan:
-        ws2.append(r)
-    for cell in ws2[1]:
-        cell.font = bold
-        cell.alignment = Alignment(vertical="center")
     ws2.column_dimensions["A"].width = 30
+    encabezado(ws2, ["nombre"])
+
+    try:
+        for nombre, confirma, menu, mensaje, created_at in filas:
+            if created_at:
+                ws1.append(
+                    [
+                        nombre,
+                        "si" if confirma == 1 else "no",
+                        menu or "",
+                        mensaje or "",
+                        created_at,
+                    ]
+                )
+            else:
+                ws2.append([nombre])
+    except Exception as e:
+        return Response(
+            f"Error leyendo la base: {e}",
+            mimetype="text/plain; charset=utf-8",
+            status=500,
+        )
 
     bio = io.BytesIO()
     wb.save(bio)
@@ -532,6 +917,7 @@ def admin_invitado_delete():
         return admin_redirect()
 
     db = get_db()
+    storage.bloquear_rsvps(db)
     inv = db.execute(
         "SELECT id, nombre FROM invitados WHERE id = ?", (inv_id,)
     ).fetchone()
@@ -541,13 +927,20 @@ def admin_invitado_delete():
 
     try:
         if cascade:
+            rollup_aplicar(db, [inv["nombre"]], -1)
+            marcar_borrados(db, "rsvps", rsvps_vigentes(db, [inv["nombre"]]))
             db.execute(
                 "DELETE FROM rsvps WHERE nombre = ?",
                 (inv["nombre"],),
             )
+            db.execute(
+                "DELETE FROM rsvps_archivo WHERE nombre = ?",
+                (inv["nombre"],),
+            )
         db.execute(
             "DELETE FROM invitados WHERE id = ?", (inv_id,)
         )
+        marcar_borrados(db, "invitados", [inv["id"]])
         db.commit()
         msg = f'Invitado "{inv["nombre"]}" eliminado'
         msg += (
@@ -563,113 +956,1308 @@ def admin_invitado_delete():
     return admin_redirect()
 
 
-# =========================
-# ===     MÓDULO GASTOS ===
-# =========================
+# ---------- Edición en lote (JSON) ----------
 
-def parse_monto(s: str) -> float:
-    """
-    Acepta '12.34', '12,34', '12.345,67', '12345' -> float
-    """
-    if not s:
-        return 0.0
-    s = s.strip()
-    if "," in s and "." not in s:
-        s = s.replace(",", ".")
-    s = s.replace(" ", "").replace(",", "")
-    try:
-        return float(s)
-    except Exception:
-        # fallback: si hay muchos puntos, dejar solo el último como decimal
-        try:
-            return float(s.replace(".", "", s.count(".") - 1))
-        except Exception:
-            return 0.0
+BATCH_MAX_OPS = 500
 
 
-def get_totales_base(db, n_manual: int | None, base: str):
-    total_invitados = db.execute(
-        "SELECT COUNT(*) AS c FROM invitados"
-    ).fetchone()["c"]
+class BatchError(Exception):
+    pass
 
-    total_confirmados = db.execute(
-        """
-        SELECT COUNT(*) AS c
-        FROM (
-          SELECT r1.nombre, MAX(r1.created_at) AS mx
-          FROM rsvps r1
-          GROUP BY r1.nombre
-        ) u
-        JOIN rsvps r
-          ON r.nombre = u.nombre
-         AND r.created_at = u.mx
-        WHERE r.confirma = 1
+
+def _rsvp_dict(db, rid):
+    row = db.execute(
         """
-    ).fetchone()["c"]
+        SELECT id, nombre, confirma, menu, mensaje, created_at
+        FROM rsvps WHERE id = ?
+        """,
+        (rid,),
+    ).fetchone()
+    return dict(row) if row else None
 
-    if base == "confirmados":
-        n_base = total_confirmados
-    elif base == "manual":
-        n_base = max(0, int(n_manual or 0))
-    else:
-        base = "invitados"
-        n_base = total_invitados
 
-    return total_invitados, total_confirmados, n_base, base
+def _batch_invitado(db, op, datos, cambios):
+    if op == "create":
+        nombre = (datos.get("nombre") or "").strip()
+        if not nombre:
+            raise BatchError("Falta el nombre del invitado.")
+        row = db.execute(
+            """
+            INSERT INTO invitados(nombre, updated_at) VALUES (?, ?)
+            ON CONFLICT DO NOTHING
+            RETURNING id
+            """,
+            (nombre, datetime.now().isoformat(timespec="seconds")),
+        ).fetchone()
+        if row:
+            cambios.append(
+                {"entity": "invitado", "op": "create",
+                 "id": row["id"], "row": {"id": row["id"], "nombre": nombre}}
+            )
+        return
 
+    inv_id = datos.get("id")
+    inv = db.execute(
+        "SELECT id, nombre FROM invitados WHERE id = ?", (inv_id,)
+    ).fetchone()
+    if not inv:
+        raise BatchError(f"Invitado {inv_id} no encontrado.")
+    viejo = inv["nombre"]
 
-@app.get("/gastos")
-def gastos_panel():
-    base = (request.args.get("base") or "invitados").strip().lower()
-    try:
-        n_manual = int(request.args.get("n") or 0)
-    except Exception:
-        n_manual = 0
+    if op == "update":
+        nuevo = (datos.get("nombre") or "").strip()
+        if not nuevo:
+            raise BatchError("Falta el nombre del invitado.")
+        try:
+            db.execute(
+                "UPDATE invitados SET nombre = ?, updated_at = ? WHERE id = ?",
+                (nuevo, datetime.now().isoformat(timespec="seconds"), inv["id"]),
+            )
+        except ERRORES_INTEGRIDAD:
+            raise BatchError(f'Ya existe un invitado "{nuevo}".')
+        cambios.append(
+            {"entity": "invitado", "op": "update",
+             "id": inv["id"], "row": {"id": inv["id"], "nombre": nuevo}}
+        )
+        if datos.get("cascade") and viejo != nuevo:
+            ids = [
+                r["id"]
+                for r in db.execute(
+                    "SELECT id FROM rsvps WHERE nombre = ?", (viejo,)
+                ).fetchall()
+            ]
+            rollup_aplicar(db, [viejo, nuevo], -1)
+            antes = rsvps_vigentes(db, [viejo, nuevo])
+            db.execute(
+                "UPDATE rsvps SET nombre = ? WHERE nombre = ?",
+                (nuevo, viejo),
+            )
+            db.execute(
+                "UPDATE rsvps_archivo SET nombre = ? WHERE nombre = ?",
+                (nuevo, viejo),
+            )
+            rollup_aplicar(db, [viejo, nuevo], 1)
+            marcar_rsvps_cambiados(db, [viejo, nuevo], antes)
+            for rid in ids:
+                cambios.append(
+                    {"entity": "rsvp", "op": "update",
+                     "id": rid, "row": _rsvp_dict(db, rid)}
+                )
+        return
+
+    if op == "delete":
+        if datos.get("cascade"):
+            ids = [
+                r["id"]
+                for r in db.execute(
+                    "SELECT id FROM rsvps WHERE nombre = ?", (viejo,)
+                ).fetchall()
+            ]
+            rollup_aplicar(db, [viejo], -1)
+            marcar_borrados(db, "rsvps", rsvps_vigentes(db, [viejo]))
+            db.execute("DELETE FROM rsvps WHERE nombre = ?", (viejo,))
+            db.execute(
+                "DELETE FROM rsvps_archivo WHERE nombre = ?", (viejo,)
+            )
+            for rid in ids:
+                cambios.append(
+                    {"entity": "rsvp", "op": "delete", "id": rid, "row": None}
+                )
+        db.execute("DELETE FROM invitados WHERE id = ?", (inv["id"],))
+        marcar_borrados(db, "invitados", [inv["id"]])
+        cambios.append(
+            {"entity": "invitado", "op": "delete", "id": inv["id"], "row": None}
+        )
+        return
+
+    raise BatchError(f"Operación desconocida: {op}")
+
+
+def _batch_rsvp(db, op, datos, cambios):
+    if op == "delete":
+        rid = datos.get("id")
+        previo = _rsvp_dict(db, rid)
+        if not previo:
+            raise BatchError(f"RSVP {rid} no encontrado.")
+        rollup_aplicar(db, [previo["nombre"]], -1)
+        antes = rsvps_vigentes(db, [previo["nombre"]])
+        db.execute("DELETE FROM rsvps WHERE id = ?", (rid,))
+        rollup_aplicar(db, [previo["nombre"]], 1)
+        marcar_rsvps_cambiados(db, [previo["nombre"]], antes)
+        cambios.append({"entity": "rsvp", "op": "delete", "id": rid, "row": None})
+        return
+
+    if op not in ("create", "update"):
+        raise BatchError(f"Operación desconocida: {op}")
+
+    nombre = (datos.get("nombre") or "").strip()
+    confirma = str(datos.get("confirma", ""))
+    mensaje = (datos.get("mensaje") or "").strip() or None
+    if not nombre or confirma not in ("0", "1"):
+        raise BatchError("Datos incompletos para el RSVP.")
+    menu = normalize_menu(datos.get("menu") or "")
+    if confirma == "0":
+        menu = None
 
-    db = get_db()
-    (
-        total_invitados,
-        total_confirmados,
-        n_base,
-        base,
-    ) = get_totales_base(db, n_manual, base)
+    afectados = {nombre}
+    if op == "update":
+        previo = _rsvp_dict(db, datos.get("id"))
+        if not previo:
+            raise BatchError(f"RSVP {datos.get('id')} no encontrado.")
+        afectados.add(previo["nombre"])
+    rollup_aplicar(db, afectados, -1)
+    antes = rsvps_vigentes(db, afectados)
+
+    if op == "create":
+        rid = db.execute(
+            """
+            INSERT INTO rsvps (nombre, confirma, menu, mensaje, created_at)
+            VALUES (?, ?, ?, ?, ?)
+            RETURNING id
+            """,
+            (nombre, int(confirma), menu, mensaje,
+             datetime.now().isoformat(timespec="seconds")),
+        ).fetchone()["id"]
+    else:
+        rid = datos.get("id")
+        cur = db.execute(
+            """
+            UPDATE rsvps
+               SET nombre = ?,
+                   confirma = ?,
+                   menu = ?,
+                   mensaje = ?
+             WHERE id = ?
+            """,
+            (nombre, int(confirma), menu, mensaje, rid),
+        )
+        if not cur.rowcount:
+            raise BatchError(f"RSVP {rid} no encontrado.")
+    rollup_aplicar(db, afectados, 1)
+    marcar_rsvps_cambiados(db, afectados, antes)
 
-    filas = db.execute(
-        """
-        SELECT id, concepto, tipo, monto, notas, created_at
-        FROM gastos
-        ORDER BY created_at DESC, id DESC
-        """
-    ).fetchall()
+    cambios.append(
+        {"entity": "rsvp", "op": op, "id": rid, "row": _rsvp_dict(db, rid)}
+    )
 
-    total_por_invitado = 0.0
-    total_totales = 0.0
-    filas_calc = []
-    for r in filas:
-        if r["tipo"] == "por_invitado":
-            total_linea = (r["monto"] or 0.0) * n_base
-            total_por_invitado += total_linea
-        else:
-            total_linea = (r["monto"] or 0.0)
-            total_totales += total_linea
 
-        filas_calc.append(
-            {
-                "id": r["id"],
-                "concepto": r["concepto"],
-                "tipo": r["tipo"],
-                "monto": float(r["monto"] or 0.0),
-                "notas": r["notas"],
-                "created_at": r["created_at"],
-                "total_linea": float(total_linea),
-            }
-        )
+@app.post("/admin/batch")
+def admin_batch():
+    """
+    Aplica en una sola transacción una lista de cambios:
+      {"ops": [{"entity": "invitado"|"rsvp",
+                "op": "create"|"update"|"delete", ...campos}]}
+    Si alguno falla no se guarda nada. Devuelve sólo las filas tocadas.
+    """
+    key = request.args.get("key", "")
+    if key != ADMIN_KEY:
+        abort(401)
 
-    gran_total = total_por_invitado + total_totales
-    costo_por_invitado = (
-        (gran_total / n_base) if n_base > 0 else 0.0
+    body = request.get_json(silent=True)
+    ops = body.get("ops") if isinstance(body, dict) else None
+    if not isinstance(ops, list):
+        return jsonify({"ok": False, "error": "Falta la lista de cambios."}), 400
+    if len(ops) > BATCH_MAX_OPS:
+        return jsonify(
+            {"ok": False, "error": f"Máximo {BATCH_MAX_OPS} cambios por lote."}
+        ), 400
+
+    db = get_db()
+    storage.bloquear_rsvps(db)
+    cambios = []
+    for i, datos in enumerate(ops):
+        try:
+            if not isinstance(datos, dict):
+                raise BatchError("Cambio inválido.")
+            entidad = datos.get("entity")
+            if entidad == "invitado":
+                _batch_invitado(db, datos.get("op"), datos, cambios)
+            elif entidad == "rsvp":
+                _batch_rsvp(db, datos.get("op"), datos, cambios)
+            else:
+                raise BatchError(f"Entidad desconocida: {entidad}")
+        except Exception as e:
+            db.rollback()
+            return jsonify({"ok": False, "index": i, "error": str(e)}), 400
+
+    db.commit()
+    return jsonify(
+        {
+            "ok": True,
+            "changed": cambios,
+            "resumen": resumen_admin(db),
+            "cant_invitados": db.execute(
+                "SELECT COUNT(*) AS c FROM invitados"
+            ).fetchone()["c"],
+        }
     )
 
+
+@app.get("/admin/limites.json")
+def admin_limites():
+    key = request.args.get("key", "")
+    if key != ADMIN_KEY:
+        abort(401)
+
+    con = get_rate_db()
+    contadores = dict(
+        con.execute("SELECT nombre, valor FROM contadores ORDER BY nombre")
+    )
+    return jsonify(
+        {
+            "ok": True,
+            "contadores": contadores,
+            "cola_accept": cola_accept(),
+            "buckets": con.execute("SELECT COUNT(*) FROM buckets").fetchone()[0],
+            "limites": {
+                k: {"burst": c, "por_seg": r} for k, (c, r) in RATE_LIMITS.items()
+            },
+            "shed": {
+                "max_cola": SHED_MAX_COLA,
+                "max_espera_ms": SHED_MAX_ESPERA_MS,
+                "header_inicio": SHED_HEADER_INICIO,
+                "puerto": SHED_PUERTO,
+            },
+        }
+    )
+
+
+@app.get("/admin/profiles")
+def admin_profiles():
+    key = request.args.get("key", "")
+    if key != ADMIN_KEY:
+        abort(401)
+    return jsonify({"ok": True, "items": profiler.listar(PROFILE_DIR)})
+
+
+@app.get("/admin/profiles/<nombre>")
+def admin_profile_descargar(nombre):
+    key = request.args.get("key", "")
+    if key != ADMIN_KEY:
+        abort(401)
+    path = profiler.ruta_segura(PROFILE_DIR, nombre)
+    if not path:
+        abort(404)
+
+    if request.args.get("formato") == "folded":
+        with open(path) as f:
+            folded = profiler.a_folded(json.load(f))
+        resp = Response(folded, mimetype="text/plain; charset=utf-8")
+        resp.headers["Content-Disposition"] = (
+            f"attachment; filename={nombre.replace('.speedscope.json', '.folded')}"
+        )
+        return resp
+    return send_file(path, mimetype="application/json", as_attachment=True)
+
+
+@app.post("/admin/profiles/borrar")
+def admin_profiles_borrar():
+    key = request.form.get("key", "")
+    if key != ADMIN_KEY:
+        abort(401)
+    for item in profiler.listar(PROFILE_DIR):
+        profiler.borrar(PROFILE_DIR, item["archivo"])
+    flash("Profiles borrados.", "success")
+    return admin_redirect()
+
+
+# =========================
+# ===   API DE DATOS    ===
+# =========================
+
+# Cada dataset: (columnas, SQL, filtro para `since`, orden).
+# `since` es una fecha ISO (se pasa a hora local, ver hora_local) y filtra
+# por updated_at, que tocan todas las escrituras (altas, ediciones,
+# renombres); las filas que salen del dataset dejan un tombstone en
+# `borrados` (ver marcar_borrados). Con since la respuesta trae además la
+# columna `_borrado`: 0 en las filas y 1 en los tombstones, que sólo traen
+# el id y la fecha del borrado en updated_at.
+# Se usa >= para no perder filas del mismo segundo: el consumidor debería
+# hacer upsert por id y seguir desde el mayor updated_at que vio.
+# En rsvps el dataset es la respuesta vigente de cada invitado: la que deja
+# de serlo (porque llegó otra, se borró o se renombró) cuenta como borrada.
+DATASETS = {
+    "invitados": (
+        ("id", "nombre", "updated_at"),
+        "SELECT id, nombre, updated_at FROM invitados",
+        "updated_at >= ?",
+        "id",
+    ),
+    "rsvps": (
+        ("id", "nombre", "confirma", "menu", "mensaje", "created_at",
+         "updated_at"),
+        """
+        SELECT id, nombre, confirma, menu, mensaje, created_at,
+               COALESCE(updated_at, created_at) AS updated_at
+        FROM (
+          SELECT r.*,
+                 ROW_NUMBER() OVER (
+                   PARTITION BY r.nombre
+                   ORDER BY r.created_at DESC, r.id DESC
+                 ) AS pos
+          FROM rsvps r
+        ) ult
+        WHERE pos = 1
+        """,
+        "COALESCE(updated_at, created_at) >= ?",
+        "updated_at, id",
+    ),
+    "gastos": (
+        ("id", "concepto", "tipo", "monto_cent", "notas", "created_at",
+         "updated_at"),
+        """
+        SELECT id, concepto, tipo, monto_cent, notas, created_at,
+               COALESCE(updated_at, created_at) AS updated_at
+        FROM gastos
+        """,
+        "COALESCE(updated_at, created_at) >= ?",
+        "updated_at, id",
+    ),
+}
+
+
+def marcar_borrados(db, tabla: str, ids):
+    """Deja un tombstone por cada fila que sale del dataset `tabla`."""
+    ahora = datetime.now().isoformat(timespec="seconds")
+    db.executemany(
+        "INSERT INTO borrados (tabla, fila_id, deleted_at) VALUES (?, ?, ?)",
+        [(tabla, i, ahora) for i in ids],
+    )
+
+
+def rsvps_vigentes(db, nombres) -> set:
+    """Ids de la respuesta vigente (la última) de estos invitados."""
+    nombres = [n for n in set(nombres) if n]
+    if not nombres:
+        return set()
+    filas = db.execute(
+        f"""
+        SELECT id FROM (
+          SELECT id,
+                 ROW_NUMBER() OVER (
+                   PARTITION BY nombre
+                   ORDER BY created_at DESC, id DESC
+                 ) AS pos
+          FROM rsvps
+          WHERE nombre IN ({", ".join("?" for _ in nombres)})
+        ) ult
+        WHERE pos = 1
+        """,
+        nombres,
+    ).fetchall()
+    return {f["id"] for f in filas}
+
+
+def marcar_rsvps_cambiados(db, nombres, antes: set):
+    """
+    Después de escribir rsvps de estos invitados (`antes` es lo que dio
+    rsvps_vigentes() antes de escribir): las vigentes quedan con updated_at
+    nuevo y las que dejaron de serlo, con su tombstone.
+    """
+    despues = rsvps_vigentes(db, nombres)
+    marcar_borrados(db, "rsvps", antes - despues)
+    if not despues:
+        return
+    marcas = ", ".join("?" for _ in despues)
+    db.execute(
+        f"UPDATE rsvps SET updated_at = ? WHERE id IN ({marcas})",
+        (datetime.now().isoformat(timespec="seconds"), *despues),
+    )
+    # una que vuelve a ser vigente (se borró la que la tapaba) ya no está borrada
+    db.execute(
+        f"DELETE FROM borrados WHERE tabla = 'rsvps' AND fila_id IN ({marcas})",
+        tuple(despues),
+    )
+
+STREAM_CHUNK = 500
+
+
+def _con_borrados(filas, tabla, since, n_columnas):
+    """Las filas (con _borrado = 0) y después los tombstones desde `since`."""
+    for f in filas:
+        yield (*f, 0)
+    vacias = (None,) * (n_columnas - 3)
+    for fila_id, deleted_at in stream_db(
+        """
+        SELECT fila_id, deleted_at FROM borrados
+        WHERE tabla = ? AND deleted_at >= ?
+        ORDER BY deleted_at, fila_id
+        """,
+        (tabla, since),
+        STREAM_CHUNK,
+    ):
+        yield (fila_id, *vacias, deleted_at, 1)
+
+
+def _filas_stream(filas, columnas, fmt):
+    if fmt == "csv":
+        buf = io.StringIO()
+        w = csv.writer(buf)
+        w.writerow(columnas)
+        yield buf.getvalue()
+
+    lote = []
+    for f in filas:
+        lote.append(tuple(f))
+        if len(lote) < STREAM_CHUNK:
+            continue
+        yield _formatear_lote(lote, columnas, fmt)
+        lote = []
+    if lote:
+        yield _formatear_lote(lote, columnas, fmt)
+
+
+def _formatear_lote(lote, columnas, fmt):
+    if fmt == "csv":
+        buf = io.StringIO()
+        csv.writer(buf).writerows(lote)
+        return buf.getvalue()
+    return "".join(
+        json.dumps(dict(zip(columnas, f)), ensure_ascii=False) + "\n"
+        for f in lote
+    )
+
+
+def _gzip_stream(chunks):
+    comp = zlib.compressobj(6, zlib.DEFLATED, 31)  # 31 = formato gzip
+    for chunk in chunks:
+        data = comp.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield comp.flush()
+
+
+@app.get("/api/data/<nombre>.<fmt>")
+def api_data_stream(nombre, fmt):
+    key = request.args.get("key", "")
+    if key != ADMIN_KEY:
+        abort(401)
+    if nombre not in DATASETS or fmt not in ("ndjson", "csv"):
+        abort(404)
+
+    columnas, sql, filtro, orden = DATASETS[nombre]
+    since = (request.args.get("since") or "").strip() or None
+    if since is not None:
+        # Se compara como texto contra fechas locales: hay que normalizarla
+        since = hora_local(since)
+        if since is None:
+            return jsonify(
+                {"ok": False, "error": "since tiene que ser una fecha ISO."}
+            ), 400
+
+    params = ()
+    if since is not None:
+        conector = "AND" if "WHERE" in sql else "WHERE"
+        sql = f"{sql} {conector} {filtro}"
+        params = (since,)
+    sql = f"{sql} ORDER BY {orden}"
+
+    filas = stream_db(sql, params, STREAM_CHUNK)
+    if since is not None:
+        columnas = (*columnas, "_borrado")
+        filas = _con_borrados(filas, nombre, since, len(columnas))
+    chunks = _filas_stream(filas, columnas, fmt)
+    headers = {"Cache-Control": "no-store"}
+    if "gzip" in (request.headers.get("Accept-Encoding") or ""):
+        chunks = _gzip_stream(chunks)
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+
+    mimetype = (
+        "text/csv; charset=utf-8"
+        if fmt == "csv"
+        else "application/x-ndjson; charset=utf-8"
+    )
+    return Response(
+        stream_with_context(chunks), mimetype=mimetype, headers=headers
+    )
+
+
+# =========================
+# ===  HISTORIAL RSVPs  ===
+# =========================
+
+RSVP_CAMPOS = ("id", "nombre", "confirma", "menu", "mensaje", "created_at")
+
+
+def compactar_rsvps(db) -> int:
+    """
+    Deja en `rsvps` sólo la última respuesta de cada invitado y mueve las
+    anteriores, comprimidas, a `rsvps_archivo`. Devuelve cuántas filas movió.
+    """
+    # mueve filas entre las dos tablas que lee historial_rsvps()
+    storage.bloquear_rsvps(db)
+    viejas = db.execute(
+        """
+        SELECT id, nombre, confirma, menu, mensaje, created_at
+        FROM (
+          SELECT r.*,
+                 ROW_NUMBER() OVER (
+                   PARTITION BY r.nombre
+                   ORDER BY r.created_at DESC, r.id DESC
+                 ) AS pos
+          FROM rsvps r
+        ) ult
+        WHERE pos > 1
+        ORDER BY nombre, created_at, id
+        """
+    ).fetchall()
+    if not viejas:
+        db.rollback()
+        return 0
+
+    por_nombre = {}
+    for r in viejas:
+        por_nombre.setdefault(r["nombre"], []).append(
+            {c: r[c] for c in RSVP_CAMPOS}
+        )
+
+    ahora = datetime.now().isoformat(timespec="seconds")
+    try:
+        for nombre, filas in por_nombre.items():
+            payload = zlib.compress(
+                json.dumps(filas, ensure_ascii=False).encode("utf-8")
+            )
+            db.execute(
+                """
+                INSERT INTO rsvps_archivo (nombre, cantidad, payload, archived_at)
+                VALUES (?, ?, ?, ?)
+                """,
+                (nombre, len(filas), payload, ahora),
+            )
+        db.executemany(
+            "DELETE FROM rsvps WHERE id = ?",
+            [(r["id"],) for r in viejas],
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return len(viejas)
+
+
+def historial_rsvps(db, nombre: str | None = None) -> list[dict]:
+    """
+    Historial completo (archivado + vigente), ordenado por fecha.
+    Cada item trae `archivada` para distinguir las respuestas viejas.
+    """
+    filtro, params = "", ()
+    if nombre:
+        filtro, params = "WHERE nombre = ?", (nombre,)
+
+    items = []
+    for a in db.execute(
+        f"SELECT nombre, payload FROM rsvps_archivo {filtro}", params
+    ).fetchall():
+        for r in json.loads(zlib.decompress(a["payload"]).decode("utf-8")):
+            # el nombre puede haber cambiado después de archivar
+            r["nombre"] = a["nombre"]
+            r["archivada"] = True
+            items.append(r)
+
+    for r in db.execute(
+        f"""
+        SELECT id, nombre, confirma, menu, mensaje, created_at
+        FROM rsvps {filtro}
+        """,
+        params,
+    ).fetchall():
+        item = {c: r[c] for c in RSVP_CAMPOS}
+        item["archivada"] = False
+        items.append(item)
+
+    items.sort(key=lambda r: (r["created_at"] or "", r["id"] or 0))
+    return items
+
+
+@app.post("/admin/rsvp/compactar")
+def admin_rsvp_compactar():
+    key = request.form.get("key", "")
+    if key != ADMIN_KEY:
+        abort(401)
+
+    db = get_db()
+    try:
+        movidas = compactar_rsvps(db)
+        flash(
+            f"Historial compactado: {movidas} respuestas archivadas.",
+            "success",
+        )
+    except Exception as e:
+        flash(f"Error al compactar: {e}", "danger")
+
+    return admin_redirect()
+
+
+@app.get("/admin/rsvp/historial")
+def admin_rsvp_historial():
+    key = request.args.get("key", "")
+    if key != ADMIN_KEY:
+        abort(401)
+
+    nombre = (request.args.get("nombre") or "").strip() or None
+    items = historial_rsvps(get_db(), nombre)
+    return jsonify({"ok": True, "items": items})
+
+
+@app.cli.command("compactar-rsvps")
+def compactar_rsvps_cmd():
+    """Archiva las respuestas viejas (para correr a mano o por cron)."""
+    init_db()
+    movidas = compactar_rsvps(get_db())
+    print(f"{movidas} respuestas archivadas.")
+
+
+# =========================
+# ===   ROLLUPS RSVPs   ===
+# =========================
+
+# Por hora y por día se guarda cuánto cambió el estado vigente de los
+# invitados en ese intervalo (deltas): la suma acumulada hasta un bucket da
+# cuántos confirmados/declinados/etc. había en ese momento. `pendientes`
+# baja 1 cuando un invitado responde por primera vez; los pendientes en un
+# momento son la cantidad de invitados + esa suma acumulada.
+# Ojo: la cantidad de invitados es la de la lista actual en todos los
+# buckets. Las altas y bajas de la lista no quedan en los rollups (y
+# invitados no tiene fecha de alta para rearmarlas), así que si la lista
+# cambió, los pendientes de antes son aproximados. Lo avisa PENDIENTES_NOTA.
+#
+# Cada escritura resta el aporte de los invitados tocados, escribe, y
+# vuelve a sumar su aporte (todo en la misma transacción). Así también
+# quedan bien las ediciones del admin que reescriben el pasado.
+
+ROLLUP_ESCALAS = {"hora": 13, "dia": 10}  # largo del prefijo de created_at
+PENDIENTES_NOTA = (
+    "Pendientes se calcula sobre la lista de invitados actual: las altas y "
+    "bajas de la lista no se registran en el tiempo."
+)
+ROLLUP_CAMPOS = (
+    "respuestas",
+    "confirmados",
+    "declinados",
+    "standard",
+    "veggie",
+    "pendientes",
+)
+
+
+def _estado_rollup(confirma, menu) -> dict:
+    menu = (menu or "").lower()
+    si = confirma == 1
+    return {
+        "confirmados": int(si),
+        "declinados": int(confirma == 0),
+        "standard": int(si and menu == "standard"),
+        "veggie": int(si and menu in {"veggie", "vegano"}),
+    }
+
+
+def _aportes_rollup(items: list[dict], signo: int, deltas: dict):
+    """Suma en `deltas[(escala, bucket)]` el aporte de un historial."""
+    por_nombre = {}
+    for r in items:
+        por_nombre.setdefault(r["nombre"], []).append(r)
+
+    for filas in por_nombre.values():
+        filas.sort(key=lambda r: (r["created_at"] or "", r["id"] or 0))
+        previo = None
+        for r in filas:
+            nuevo = _estado_rollup(r["confirma"], r["menu"])
+            cambio = {"respuestas": 1, "pendientes": -1 if previo is None else 0}
+            for k, v in nuevo.items():
+                cambio[k] = v - (previo or {}).get(k, 0)
+            for escala, largo in ROLLUP_ESCALAS.items():
+                d = deltas.setdefault(
+                    (escala, r["created_at"][:largo]), dict.fromkeys(ROLLUP_CAMPOS, 0)
+                )
+                for k, v in cambio.items():
+                    d[k] += signo * v
+            previo = nuevo
+
+
+def _guardar_deltas(db, deltas: dict):
+    for escala in ROLLUP_ESCALAS:
+        filas = [
+            (bucket, *(d[k] for k in ROLLUP_CAMPOS))
+            for (esc, bucket), d in deltas.items()
+            if esc == escala and any(d.values())
+        ]
+        if not filas:
+            continue
+        db.executemany(
+            f"""
+            INSERT INTO rsvp_rollup_{escala}
+                (bucket, {", ".join(ROLLUP_CAMPOS)})
+            VALUES (?, {", ".join("?" for _ in ROLLUP_CAMPOS)})
+            ON CONFLICT(bucket) DO UPDATE SET
+                {", ".join(f"{k} = rsvp_rollup_{escala}.{k} + excluded.{k}"
+                           for k in ROLLUP_CAMPOS)}
+            """,
+            filas,
+        )
+
+
+def rollup_aplicar(db, nombres, signo: int):
+    """
+    Suma (signo=1) o resta (signo=-1) el aporte de estos invitados a los
+    rollups. No commitea: va en la transacción de la escritura, que tiene
+    que haber llamado a storage.bloquear_rsvps() antes de leer nada.
+    """
+    deltas = {}
+    for nombre in {n for n in nombres if n}:
+        _aportes_rollup(historial_rsvps(db, nombre), signo, deltas)
+    _guardar_deltas(db, deltas)
+
+
+def rollup_reconstruir(db):
+    """Rearma los rollups desde cero con todo el historial."""
+    storage.bloquear_rsvps(db)
+    for escala in ROLLUP_ESCALAS:
+        db.execute(f"DELETE FROM rsvp_rollup_{escala}")
+    deltas = {}
+    _aportes_rollup(historial_rsvps(db), 1, deltas)
+    _guardar_deltas(db, deltas)
+
+
+def rollup_backfill_inicial(db):
+    # La marca en datos_version hace que, si arrancan varios workers o
+    # máquinas a la vez, sólo uno (el que la inserta) haga el backfill.
+    marca = db.execute(
+        """
+        INSERT INTO datos_version (tabla, version) VALUES ('rollups', 1)
+        ON CONFLICT DO NOTHING
+        RETURNING version
+        """
+    ).fetchone()
+    if marca:
+        rollup_reconstruir(db)
+    db.commit()
+
+
+def leer_rollups(db, escala: str, desde: str | None, hasta: str | None) -> dict:
+    filtro, params = [], []
+    if desde:
+        filtro.append("bucket >= ?")
+        params.append(desde)
+    if hasta:
+        filtro.append("bucket <= ?")
+        params.append(hasta)
+    where = f"WHERE {' AND '.join(filtro)}" if filtro else ""
+
+    # punto de partida: lo acumulado antes del rango pedido
+    base = dict.fromkeys(ROLLUP_CAMPOS, 0)
+    if desde:
+        row = db.execute(
+            f"""
+            SELECT {", ".join(f"CAST(COALESCE(SUM({k}), 0) AS BIGINT) AS {k}"
+                              for k in ROLLUP_CAMPOS)}
+            FROM rsvp_rollup_{escala}
+            WHERE bucket < ?
+            """,
+            (desde,),
+        ).fetchone()
+        base = {k: row[k] for k in ROLLUP_CAMPOS}
+
+    filas = db.execute(
+        f"""
+        SELECT bucket, {", ".join(ROLLUP_CAMPOS)}
+        FROM rsvp_rollup_{escala}
+        {where}
+        ORDER BY bucket
+        """,
+        params,
+    ).fetchall()
+
+    cant_invitados = db.execute(
+        "SELECT COUNT(*) AS c FROM invitados"
+    ).fetchone()["c"]
+
+    acum = dict(base)
+    buckets = []
+    for f in filas:
+        item = {"bucket": f["bucket"]}
+        for k in ROLLUP_CAMPOS:
+            acum[k] += f[k]
+            item[k] = f[k]
+            item[f"{k}_acum"] = acum[k]
+        item["pendientes_acum"] = cant_invitados + acum["pendientes"]
+        buckets.append(item)
+
+    return {
+        "escala": escala,
+        "invitados": cant_invitados,
+        "pendientes_nota": PENDIENTES_NOTA,
+        "buckets": buckets,
+    }
+
+
+@app.get("/admin/rollups.json")
+def admin_rollups():
+    key = request.args.get("key", "")
+    if key != ADMIN_KEY:
+        abort(401)
+
+    escala = request.args.get("escala", "dia")
+    if escala not in ROLLUP_ESCALAS:
+        return jsonify({"ok": False, "error": "Escala inválida (hora o dia)."}), 400
+
+    datos = leer_rollups(
+        get_db(),
+        escala,
+        (request.args.get("desde") or "").strip() or None,
+        (request.args.get("hasta") or "").strip() or None,
+    )
+    return jsonify({"ok": True, **datos})
+
+
+@app.cli.command("reconstruir-rollups")
+def reconstruir_rollups_cmd():
+    """Rearma los rollups de RSVPs desde el historial."""
+    init_db()
+    db = get_db()
+    rollup_reconstruir(db)
+    db.commit()
+    print("Rollups reconstruidos.")
+
+
+# =========================
+# ===      BACKUPS      ===
+# =========================
+
+# Snapshots en caliente de la base SQLite (ver backups.py) a otra carpeta.
+# Con Postgres los backups son cosa del proveedor: acá no se hace nada.
+BACKUP_DIR = os.getenv(
+    "BACKUP_DIR", os.path.join(os.path.dirname(DB_PATH) or ".", "backups")
+)
+BACKUP_INTERVALO_MIN = float(os.getenv("BACKUP_INTERVALO_MIN", "0"))  # 0 = a mano
+BACKUP_PAGINAS = int(os.getenv("BACKUP_PAGINAS", "64"))  # páginas por paso
+BACKUP_PAUSA_MS = float(os.getenv("BACKUP_PAUSA_MS", "5"))  # pausa entre pasos
+BACKUP_ULTIMOS = int(os.getenv("BACKUP_ULTIMOS", "24"))
+BACKUP_DIARIOS = int(os.getenv("BACKUP_DIARIOS", "14"))
+BACKUP_SEMANALES = int(os.getenv("BACKUP_SEMANALES", "8"))
+
+_backups_iniciados = False
+
+
+def backups_habilitados() -> bool:
+    return storage.motor == "sqlite"
+
+
+def correr_backup() -> dict | None:
+    """Snapshot + retención. None si ya hay otro backup corriendo."""
+    candado = backups.Candado(BACKUP_DIR)
+    if not candado.tomar():
+        return None
+    try:
+        meta = backups.hacer_backup(
+            DB_PATH, BACKUP_DIR, BACKUP_PAGINAS, BACKUP_PAUSA_MS / 1000
+        )
+        meta["podados"] = backups.podar(
+            BACKUP_DIR, BACKUP_ULTIMOS, BACKUP_DIARIOS, BACKUP_SEMANALES
+        )
+        # marca para el programador (la comparten los workers)
+        with open(os.path.join(BACKUP_DIR, ".ultimo"), "w") as f:
+            f.write(meta["fecha"])
+        return meta
+    finally:
+        candado.soltar()
+
+
+def _backups_periodicos():
+    marca = os.path.join(BACKUP_DIR, ".ultimo")
+    intervalo = BACKUP_INTERVALO_MIN * 60
+    while True:
+        # desfasado al azar para que los workers no se pisen
+        time.sleep(intervalo / 10 * (1 + random.random()))
+        try:
+            if time.time() - os.path.getmtime(marca) < intervalo:
+                continue
+        except OSError:
+            pass  # nunca se hizo uno
+        try:
+            correr_backup()
+        except Exception as ex:
+            print("ERROR en backup periódico:", ex)
+
+
+def iniciar_backups_periodicos():
+    # Un hilo por worker; el candado y la marca evitan backups dobles
+    global _backups_iniciados
+    if _backups_iniciados:
+        return
+    _backups_iniciados = True
+    if BACKUP_INTERVALO_MIN > 0 and backups_habilitados():
+        threading.Thread(target=_backups_periodicos, daemon=True).start()
+
+
+@app.get("/admin/backups")
+def admin_backups():
+    key = request.args.get("key", "")
+    if key != ADMIN_KEY:
+        abort(401)
+    return jsonify(
+        {
+            "ok": True,
+            "habilitados": backups_habilitados(),
+            "carpeta": BACKUP_DIR,
+            "intervalo_min": BACKUP_INTERVALO_MIN,
+            "retencion": {
+                "ultimos": BACKUP_ULTIMOS,
+                "diarios": BACKUP_DIARIOS,
+                "semanales": BACKUP_SEMANALES,
+            },
+            "items": backups.listar(BACKUP_DIR),
+        }
+    )
+
+
+@app.post("/admin/backups/crear")
+def admin_backups_crear():
+    key = request.form.get("key", "")
+    if key != ADMIN_KEY:
+        abort(401)
+    if not backups_habilitados():
+        flash("Los backups en caliente son sólo para SQLite.", "warning")
+        return admin_redirect()
+
+    # En un hilo: el request vuelve enseguida y la copia va de a pasos
+    threading.Thread(target=correr_backup, daemon=True).start()
+    flash("Backup en marcha, aparece en la lista en unos segundos.", "success")
+    return admin_redirect()
+
+
+@app.get("/admin/backups/<nombre>")
+def admin_backup_descargar(nombre):
+    key = request.args.get("key", "")
+    if key != ADMIN_KEY:
+        abort(401)
+    path = backups.ruta_segura(BACKUP_DIR, nombre)
+    if not path:
+        abort(404)
+    return send_file(path, mimetype="application/vnd.sqlite3", as_attachment=True)
+
+
+@app.get("/admin/backups/<nombre>/verificar")
+def admin_backup_verificar(nombre):
+    key = request.args.get("key", "")
+    if key != ADMIN_KEY:
+        abort(401)
+    if not backups.ruta_segura(BACKUP_DIR, nombre):
+        abort(404)
+    error = backups.verificar(BACKUP_DIR, nombre)
+    return jsonify({"ok": error is None, "archivo": nombre, "error": error})
+
+
+@app.cli.command("backup-db")
+def backup_db_cmd():
+    """Saca un snapshot verificado de la base (para cron o a mano)."""
+    if not backups_habilitados():
+        raise click.ClickException("Los backups en caliente son sólo para SQLite.")
+    meta = correr_backup()
+    if meta is None:
+        raise click.ClickException("Ya hay un backup corriendo.")
+    if meta.get("sin_cambios"):
+        print(f"Sin cambios desde {meta['archivo']}.")
+    else:
+        print(
+            f"{meta['archivo']}: {meta['bytes']} bytes, {meta['pasos']} pasos, "
+            f"{meta['duracion_ms']} ms."
+        )
+    for n in meta["podados"]:
+        print(f"  borrado por retención: {n}")
+
+
+@app.cli.command("verificar-backups")
+def verificar_backups_cmd():
+    """Chequea integridad, filas y sha256 de todos los snapshots."""
+    malos = 0
+    for item in backups.listar(BACKUP_DIR):
+        error = backups.verificar(BACKUP_DIR, item["archivo"])
+        malos += error is not None
+        print(f"{item['archivo']}: {error or 'ok'}")
+    if malos:
+        raise click.ClickException(f"{malos} snapshots con problemas.")
+
+
+@app.cli.command("restaurar-backup")
+@click.argument("nombre")
+@click.option(
+    "--destino",
+    default=None,
+    help="Archivo nuevo donde restaurar (por defecto DB_PATH.restaurado).",
+)
+def restaurar_backup_cmd(nombre, destino):
+    """Restaura un snapshot a un archivo aparte y lo verifica."""
+    destino = destino or f"{DB_PATH}.restaurado"
+    try:
+        meta = backups.restaurar(BACKUP_DIR, nombre, destino)
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    print(f"Restaurado {nombre} ({meta.get('fecha')}) en {destino}, verificado.")
+    print(f"Para usarlo: parar la app y mover {destino} a {DB_PATH}.")
+
+
+# =========================
+# ===     MÓDULO GASTOS ===
+# =========================
+
+# Los montos se guardan en centavos (INTEGER) y se suman en SQL, así no
+# arrastramos errores de float. Para mostrar se pasan a Decimal.
+
+_RE_MONTO = re.compile(r"^\d{1,3}([.,]\d{3})+$|^\d+$")
+
+
+def parse_monto_cent(s: str) -> int:
+    """
+    Convierte un monto escrito a mano en centavos, sin pasar por float.
+    Acepta '12.34', '12,34', '12.345,67', '1,234.50', '12345', '15.000'.
+    Un único separador seguido de exactamente 3 dígitos se toma como de
+    miles (como se escribe acá: '15.000'). Lanza ValueError si no se
+    puede interpretar o si tiene más de 2 decimales.
+    """
+    s = (s or "").strip().replace(" ", "").replace("$", "")
+    if not s:
+        raise ValueError("Monto vacío.")
+    signo = 1
+    if s[0] in "+-":
+        signo = -1 if s[0] == "-" else 1
+        s = s[1:]
+    if not any(ch.isdigit() for ch in s):
+        raise ValueError(f"Monto inválido: {s!r}.")
+
+    sep_dec = None
+    if "," in s and "." in s:
+        sep_dec = "," if s.rfind(",") > s.rfind(".") else "."
+    elif s.count(",") == 1 or s.count(".") == 1:
+        sep = "," if "," in s else "."
+        if len(s) - s.index(sep) - 1 != 3:
+            sep_dec = sep
+
+    if sep_dec:
+        entero, _, dec = s.rpartition(sep_dec)
+    else:
+        entero, dec = s, ""
+
+    if not entero:
+        entero = "0"
+    if not _RE_MONTO.match(entero) or not (dec == "" or dec.isdigit()):
+        raise ValueError(f"Monto inválido: {s!r}.")
+    if len(dec) > 2:
+        raise ValueError(f"Monto con más de 2 decimales: {s!r}.")
+
+    entero = entero.replace(".", "").replace(",", "")
+    return signo * (int(entero) * 100 + int(dec.ljust(2, "0")))
+
+
+def monto_celda_cent(valor) -> int:
+    """
+    Monto de una celda de planilla. Las numéricas (XLSX) ya son el número:
+    no pasan por las heurísticas de separadores de parse_monto_cent, que
+    leerían 2.125 como 2125. El texto sí.
+    """
+    if isinstance(valor, bool):
+        raise ValueError(f"Monto inválido: {valor!r}.")
+    if isinstance(valor, (int, float, Decimal)):
+        d = Decimal(str(valor))
+        if not d.is_finite():
+            raise ValueError(f"Monto inválido: {valor!r}.")
+        if d != d.quantize(Decimal("0.01")):
+            raise ValueError(f"Monto con más de 2 decimales: {valor!r}.")
+        return int(d * 100)
+    return parse_monto_cent("" if valor is None else str(valor))
+
+
+def cent_a_decimal(c: int | None) -> Decimal:
+    return Decimal(int(c or 0)).scaleb(-2)
+
+
+def cent_a_texto(c: int | None) -> str:
+    """Monto en formato editable: '15000' o '15000,50'."""
+    pesos, cent = divmod(int(c or 0), 100)
+    return f"{pesos},{cent:02d}" if cent else str(pesos)
+
+
+def get_totales_base(db, n_manual: int | None, base: str):
+    total_invitados = db.execute(
+        "SELECT COUNT(*) AS c FROM invitados"
+    ).fetchone()["c"]
+
+    total_confirmados = db.execute(
+        """
+        SELECT COUNT(*) AS c
+        FROM (
+          SELECT r1.nombre, MAX(r1.created_at) AS mx
+          FROM rsvps r1
+          GROUP BY r1.nombre
+        ) u
+        JOIN rsvps r
+          ON r.nombre = u.nombre
+         AND r.created_at = u.mx
+        WHERE r.confirma = 1
+        """
+    ).fetchone()["c"]
+
+    if base == "confirmados":
+        n_base = total_confirmados
+    elif base == "manual":
+        n_base = max(0, int(n_manual or 0))
+    else:
+        base = "invitados"
+        n_base = total_invitados
+
+    return total_invitados, total_confirmados, n_base, base
+
+
+# Filas de gastos con el total de cada línea (`:n` = invitados de base)
+SQL_GASTOS_FILAS = """
+    SELECT id, concepto, tipo, monto_cent, notas, created_at,
+           CASE WHEN tipo = 'por_invitado'
+                THEN monto_cent * :n
+                ELSE monto_cent
+           END AS total_linea_cent
+    FROM gastos
+    ORDER BY created_at DESC, id DESC
+"""
+
+
+def get_gastos_totales(db, n_base: int):
+    """Subtotales calculados en SQL sobre enteros (centavos), en Decimal."""
+    tot = db.execute(
+        """
+        SELECT
+          CAST(COALESCE(SUM(CASE WHEN tipo = 'por_invitado'
+                                 THEN monto_cent END), 0) AS BIGINT)
+            * :n AS por_invitado,
+          CAST(COALESCE(SUM(CASE WHEN tipo = 'total'
+                                 THEN monto_cent END), 0) AS BIGINT)
+            AS totales
+        FROM gastos
+        """,
+        {"n": n_base},
+    ).fetchone()
+
+    total_por_invitado = cent_a_decimal(tot["por_invitado"])
+    total_totales = cent_a_decimal(tot["totales"])
+    gran_total = total_por_invitado + total_totales
+    costo_por_invitado = (
+        (gran_total / n_base).quantize(Decimal("0.01"), ROUND_HALF_UP)
+        if n_base > 0
+        else Decimal("0.00")
+    )
+    return total_por_invitado, total_totales, gran_total, costo_por_invitado
+
+
+def get_gastos_calc(db, n_base: int):
+    """
+    Filas de gastos con el total de cada línea y los subtotales, todo
+    calculado en SQL sobre enteros (centavos). Devuelve Decimals.
+    """
+    filas = db.execute(SQL_GASTOS_FILAS, {"n": n_base}).fetchall()
+    return (filas, *get_gastos_totales(db, n_base))
+
+
+# ---------- Escenarios (costo según cantidad de invitados) ----------
+
+# El costo es lineal en n: gran_total(n) = PI * n + T, con PI la suma de
+# los gastos "por invitado" y T la de los "total". Alcanza con dos sumas
+# para evaluar cualquier rango de n de una vez.
+ESCENARIOS_MAX_PUNTOS = 2000
+_escenarios_cache: dict = {}
+
+
+def calcular_escenarios(db, desde: int, hasta: int, paso: int) -> dict:
+    version = db.execute(
+        "SELECT version FROM datos_version WHERE tabla = 'gastos'"
+    ).fetchone()["version"]
+    clave = (storage.nombre, version, desde, hasta, paso)
+    if clave in _escenarios_cache:
+        return _escenarios_cache[clave]
+
+    tot = db.execute(
+        """
+        SELECT
+          CAST(COALESCE(SUM(CASE WHEN tipo = 'por_invitado'
+                                 THEN monto_cent END), 0) AS BIGINT) AS pi,
+          CAST(COALESCE(SUM(CASE WHEN tipo = 'total'
+                                 THEN monto_cent END), 0) AS BIGINT) AS t
+        FROM gastos
+        """
+    ).fetchone()
+    pi, t = tot["pi"], tot["t"]
+
+    ns = range(desde, hasta + 1, paso)
+    gran = [pi * n + t for n in ns]
+    # costo por invitado redondeado al centavo (half up), en enteros
+    costo = [(2 * g + n) // (2 * n) if n > 0 else 0 for g, n in zip(gran, ns)]
+
+    resultado = {
+        "version": version,
+        "por_invitado_cent": pi,
+        "totales_cent": t,
+        "n": list(ns),
+        "gran_total_cent": gran,
+        "costo_por_invitado_cent": costo,
+    }
+    if len(_escenarios_cache) >= 64:
+        _escenarios_cache.clear()
+    _escenarios_cache[clave] = resultado
+    return resultado
+
+
+@app.get("/gastos/escenarios.json")
+def gastos_escenarios():
+    try:
+        desde = max(1, int(request.args.get("desde") or 1))
+        hasta = max(desde, int(request.args.get("hasta") or 300))
+        paso = max(1, int(request.args.get("paso") or 1))
+    except ValueError:
+        return jsonify({"ok": False, "error": "Rango inválido."}), 400
+
+    if (hasta - desde) // paso + 1 > ESCENARIOS_MAX_PUNTOS:
+        paso = (hasta - desde) // (ESCENARIOS_MAX_PUNTOS - 1) + 1
+
+    datos = calcular_escenarios(get_db(), desde, hasta, paso)
+    return jsonify({"ok": True, "paso": paso, **datos})
+
+
+@app.get("/gastos")
+def gastos_panel():
+    base = (request.args.get("base") or "invitados").strip().lower()
+    try:
+        n_manual = int(request.args.get("n") or 0)
+    except Exception:
+        n_manual = 0
+
+    db = get_db()
+    (
+        total_invitados,
+        total_confirmados,
+        n_base,
+        base,
+    ) = get_totales_base(db, n_manual, base)
+
+    (
+        filas,
+        total_por_invitado,
+        total_totales,
+        gran_total,
+        costo_por_invitado,
+    ) = get_gastos_calc(db, n_base)
+
+    filas_calc = [
+        {
+            "id": r["id"],
+            "concepto": r["concepto"],
+            "tipo": r["tipo"],
+            "monto": cent_a_decimal(r["monto_cent"]),
+            "monto_raw": cent_a_texto(r["monto_cent"]),
+            "notas": r["notas"],
+            "created_at": r["created_at"],
+            "total_linea": cent_a_decimal(r["total_linea_cent"]),
+        }
+        for r in filas
+    ]
+
     return render_template(
         "gastos.html",
         base=base,
@@ -704,8 +2292,14 @@ def gastos_agregar():
             url_for("gastos_panel", base=base, n=n_manual)
         )
 
-    monto = parse_monto(monto_raw)
-    if monto < 0:
+    try:
+        monto_cent = parse_monto_cent(monto_raw)
+    except ValueError as e:
+        flash(str(e), "danger")
+        return redirect(
+            url_for("gastos_panel", base=base, n=n_manual)
+        )
+    if monto_cent < 0:
         flash(
             "El monto no puede ser negativo.", "danger"
         )
@@ -716,13 +2310,13 @@ def gastos_agregar():
     db = get_db()
     db.execute(
         """
-        INSERT INTO gastos (concepto, tipo, monto, notas, created_at)
+        INSERT INTO gastos (concepto, tipo, monto_cent, notas, created_at)
         VALUES (?, ?, ?, ?, ?)
         """,
         (
             concepto,
             tipo,
-            monto,
+            monto_cent,
             notas,
             datetime.now().isoformat(timespec="seconds"),
         ),
@@ -756,8 +2350,14 @@ def gastos_editar():
             url_for("gastos_panel", base=base, n=n_manual)
         )
 
-    monto = parse_monto(monto_raw)
-    if monto < 0:
+    try:
+        monto_cent = parse_monto_cent(monto_raw)
+    except ValueError as e:
+        flash(str(e), "danger")
+        return redirect(
+            url_for("gastos_panel", base=base, n=n_manual)
+        )
+    if monto_cent < 0:
         flash(
             "El monto no puede ser negativo.", "danger"
         )
@@ -769,10 +2369,12 @@ def gastos_editar():
     db.execute(
         """
         UPDATE gastos
-           SET concepto = ?, tipo = ?, monto = ?, notas = ?
+           SET concepto = ?, tipo = ?, monto_cent = ?, notas = ?,
+               updated_at = ?
          WHERE id = ?
         """,
-        (concepto, tipo, monto, notas, gid),
+        (concepto, tipo, monto_cent, notas,
+         datetime.now().isoformat(timespec="seconds"), gid),
     )
     db.commit()
     flash("Gasto actualizado.", "success")
@@ -790,9 +2392,11 @@ def gastos_borrar(gid):
         n_manual = 0
 
     db = get_db()
-    db.execute(
+    cur = db.execute(
         "DELETE FROM gastos WHERE id = ?", (gid,)
     )
+    if cur.rowcount:
+        marcar_borrados(db, "gastos", [gid])
     db.commit()
     flash("Gasto eliminado.", "success")
     return redirect(
@@ -800,6 +2404,147 @@ def gastos_borrar(gid):
     )
 
 
+# ---------- Importación masiva ----------
+
+GASTOS_COLUMNAS = ("concepto", "tipo", "monto", "notas")
+TIPOS_ALIAS = {
+    "por_invitado": "por_invitado",
+    "por invitado": "por_invitado",
+    "invitado": "por_invitado",
+    "total": "total",
+    "general": "total",
+}
+
+
+def _leer_planilla(archivo) -> list[list]:
+    nombre = (archivo.filename or "").lower()
+    if nombre.endswith(".xlsx"):
+        from openpyxl import load_workbook
+
+        wb = load_workbook(archivo, read_only=True, data_only=True)
+        return [list(r) for r in wb.active.iter_rows(values_only=True)]
+
+    texto = archivo.read().decode("utf-8-sig")
+    try:
+        dialecto = csv.Sniffer().sniff(texto[:4096], delimiters=",;\t")
+    except csv.Error:
+        dialecto = csv.excel
+    return list(csv.reader(io.StringIO(texto), dialecto))
+
+
+def validar_gastos(filas: list[list]):
+    """
+    Valida todas las filas (la primera es el encabezado) columna por
+    columna y devuelve (válidas, rechazadas). Las válidas ya vienen como
+    tuplas listas para el INSERT; las rechazadas como (n_fila, motivo).
+    """
+    if not filas:
+        return [], [(1, "Archivo vacío.")]
+
+    encabezado = [str(c or "").strip().lower() for c in filas[0]]
+    faltan = [c for c in ("concepto", "tipo", "monto") if c not in encabezado]
+    if faltan:
+        return [], [(1, f"Faltan columnas: {', '.join(faltan)}.")]
+    idx = {c: encabezado.index(c) for c in GASTOS_COLUMNAS if c in encabezado}
+
+    cuerpo = filas[1:]
+
+    def col(nombre):
+        i = idx.get(nombre)
+        return [
+            "" if i is None or i >= len(f) or f[i] is None else str(f[i]).strip()
+            for f in cuerpo
+        ]
+
+    conceptos = col("concepto")
+    tipos = [TIPOS_ALIAS.get(t.lower()) for t in col("tipo")]
+    notas = col("notas")
+
+    i_monto = idx["monto"]
+    montos, errores_monto = [], {}
+    for i, f in enumerate(cuerpo):
+        try:
+            c = monto_celda_cent(f[i_monto] if i_monto < len(f) else None)
+            if c < 0:
+                raise ValueError("Monto negativo.")
+            montos.append(c)
+        except ValueError as e:
+            montos.append(None)
+            errores_monto[i] = str(e)
+
+    ahora = datetime.now().isoformat(timespec="seconds")
+    validas, rechazadas = [], []
+    for i, (concepto, tipo, monto, nota) in enumerate(
+        zip(conceptos, tipos, montos, notas)
+    ):
+        n_fila = i + 2
+        if not any(cuerpo[i]):
+            continue
+        if not concepto:
+            rechazadas.append((n_fila, "Falta el concepto."))
+        elif tipo is None:
+            rechazadas.append((n_fila, "Tipo inválido (por_invitado o total)."))
+        elif monto is None:
+            rechazadas.append((n_fila, errores_monto[i]))
+        else:
+            validas.append((concepto, tipo, monto, nota or None, ahora))
+    return validas, rechazadas
+
+
+@app.post("/gastos/importar")
+def gastos_importar():
+    base = (request.args.get("base") or "invitados").strip().lower()
+    try:
+        n_manual = int(request.args.get("n") or 0)
+    except Exception:
+        n_manual = 0
+
+    archivo = request.files.get("archivo")
+    if not archivo or not archivo.filename:
+        flash("Elegí un archivo CSV o XLSX.", "danger")
+        return redirect(
+            url_for("gastos_panel", base=base, n=n_manual)
+        )
+
+    try:
+        validas, rechazadas = validar_gastos(_leer_planilla(archivo))
+    except Exception as e:
+        flash(f"No se pudo leer el archivo: {e}", "danger")
+        return redirect(
+            url_for("gastos_panel", base=base, n=n_manual)
+        )
+
+    db = get_db()
+    try:
+        db.executemany(
+            """
+            INSERT INTO gastos (concepto, tipo, monto_cent, notas, created_at)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            validas,
+        )
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        flash(f"Error al importar: {e}", "danger")
+        return redirect(
+            url_for("gastos_panel", base=base, n=n_manual)
+        )
+
+    flash(
+        f"Importados {len(validas)} gastos, rechazadas {len(rechazadas)} filas.",
+        "success" if not rechazadas else "warning",
+    )
+    for n_fila, motivo in rechazadas[:20]:
+        flash(f"Fila {n_fila}: {motivo}", "warning")
+    if len(rechazadas) > 20:
+        flash(f"... y {len(rechazadas) - 20} filas rechazadas más.", "warning")
+
+    return redirect(
+        url_for("gastos_panel", base=base, n=n_manual)
+    )
+
+
 @app.get("/gastos/export.xlsx")
 def gastos_export_xlsx():
     base = (request.args.get("base") or "invitados").strip().lower()
@@ -810,6 +2555,7 @@ def gastos_export_xlsx():
 
     try:
         from openpyxl import Workbook
+        from openpyxl.cell import WriteOnlyCell
         from openpyxl.styles import Font, Alignment
         from openpyxl.utils import get_column_letter
     except Exception:
@@ -827,46 +2573,31 @@ def gastos_export_xlsx():
         base,
     ) = get_totales_base(db, n_manual, base)
 
-    filas = db.execute(
-        """
-        SELECT id, concepto, tipo, monto, notas, created_at
-        FROM gastos
-        ORDER BY created_at DESC, id DESC
-        """
-    ).fetchall()
-
-    total_por_invitado = 0.0
-    total_totales = 0.0
-    rows = []
-    for r in filas:
-        if r["tipo"] == "por_invitado":
-            total_linea = (r["monto"] or 0.0) * n_base
-            total_por_invitado += total_linea
-        else:
-            total_linea = (r["monto"] or 0.0)
-            total_totales += total_linea
+    (
+        total_por_invitado,
+        total_totales,
+        gran_total,
+        costo_por_invitado,
+    ) = get_gastos_totales(db, n_base)
 
-        rows.append(
-            [
-                r["created_at"],
-                r["concepto"],
-                r["tipo"],
-                float(r["monto"] or 0.0),
-                n_base if r["tipo"] == "por_invitado" else "",
-                float(total_linea),
-                r["notas"] or "",
-            ]
-        )
+    # Filas con stream_db() y libro write_only (ver admin_export_xlsx)
+    filas = stream_db(SQL_GASTOS_FILAS, {"n": n_base})
 
-    gran_total = total_por_invitado + total_totales
-    costo_por_invitado = (
-        (gran_total / n_base) if n_base > 0 else 0.0
-    )
+    wb = Workbook(write_only=True)
+    bold = Font(bold=True)
 
-    wb = Workbook()
+    def negrita(ws, valor):
+        c = WriteOnlyCell(ws, value=valor)
+        c.font = bold
+        c.alignment = Alignment(vertical="center")
+        return c
 
-    ws1 = wb.active
-    ws1.title = "Gastos"
+    ws1 = wb.create_sheet("Gastos")
+    widths = [20, 28, 14, 14, 10, 16, 40]
+    for i, w in enumerate(widths, start=1):
+        ws1.column_dimensions[
+            get_column_letter(i)
+        ].width = w
     headers1 = [
         "fecha",
         "concepto",
@@ -876,29 +2607,30 @@ def gastos_export_xlsx():
         "total_linea",
         "notas",
     ]
-    ws1.append(headers1)
-    for row in rows:
-        ws1.append(row)
-
-    bold = Font(bold=True)
-    for cell in ws1[1]:
-        cell.font = bold
-        cell.alignment = Alignment(vertical="center")
+    ws1.append([negrita(ws1, h) for h in headers1])
 
-    widths = [20, 28, 14, 14, 10, 16, 40]
-    for i, w in enumerate(widths, start=1):
-        ws1.column_dimensions[
-            get_column_letter(i)
-        ].width = w
+    for _id, concepto, tipo, monto_cent, notas, created_at, total_linea in filas:
+        ws1.append(
+            [
+                created_at,
+                concepto,
+                tipo,
+                cent_a_decimal(monto_cent),
+                n_base if tipo == "por_invitado" else "",
+                cent_a_decimal(total_linea),
+                notas or "",
+            ]
+        )
 
     ws2 = wb.create_sheet("Resumen")
-    ws2.append(["Base usada", n_base])
-    ws2.append(["Total por invitado", total_por_invitado])
-    ws2.append(["Total (totales)", total_totales])
-    ws2.append(["Gran total", gran_total])
-    ws2.append(["Costo por invitado", costo_por_invitado])
-    for cell in ws2["A1":"A5"][0]:
-        cell.font = bold
+    for etiqueta, valor in [
+        ("Base usada", n_base),
+        ("Total por invitado", total_por_invitado),
+        ("Total (totales)", total_totales),
+        ("Gran total", gran_total),
+        ("Costo por invitado", costo_por_invitado),
+    ]:
+        ws2.append([negrita(ws2, etiqueta), valor])
 
     bio = io.BytesIO()
     wb.save(bio)
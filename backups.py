@@ -0,0 +1,290 @@
+"""
+Backups en caliente de la base SQLite.
+
+Se usa la API de backup de SQLite de a pocas páginas por paso, con una
+pausa entre pasos, así no se le roba el disco ni el GIL a /enviar. La base
+está en modo WAL (ver storage.py): la conexión de origen abre una
+transacción de lectura y la mantiene durante toda la copia, así que la foto
+es consistente (ese instante exacto), los que escriben no se frenan y la
+copia no tiene que volver a empezar cada vez que alguien confirma.
+
+Cada snapshot queda como un .db común (sin WAL) con su .meta.json al lado:
+cantidad de filas por tabla (contadas dentro de la misma transacción),
+sha256, páginas y tiempos. Si la base no cambió desde el último snapshot no
+se guarda otro igual.
+
+Retención por escalones: los últimos N, más el último de cada día y el
+último de cada semana por un tiempo.
+"""
+import fcntl
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+from datetime import datetime
+
+_RE_NOMBRE = re.compile(r"^rsvps_\d{8}_\d{6}\.db$")
+
+
+def _contar_filas(con) -> dict:
+    tablas = [
+        r[0]
+        for r in con.execute(
+            "SELECT name FROM sqlite_master "
+            "WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+        )
+    ]
+    return {
+        t: con.execute(f'SELECT COUNT(*) FROM "{t}"').fetchone()[0] for t in tablas
+    }
+
+
+def _sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for bloque in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def _meta_path(path: str) -> str:
+    return path[: -len(".db")] + ".meta.json"
+
+
+def _copiar(origen, destino, paginas: int, pausa: float) -> int:
+    """Copia con la API de backup, `paginas` por paso. Devuelve los pasos."""
+    pasos = 0
+
+    def progreso(_status, _restantes, _total):
+        nonlocal pasos
+        pasos += 1
+        if pausa:
+            time.sleep(pausa)  # suelta el GIL y el disco entre paso y paso
+
+    origen.backup(destino, pages=paginas, progress=progreso)
+    return pasos
+
+
+def hacer_backup(
+    db_path: str, carpeta: str, paginas: int = 64, pausa: float = 0.005
+) -> dict:
+    """Saca un snapshot de db_path a `carpeta`, verificado. Devuelve su meta."""
+    os.makedirs(carpeta, exist_ok=True)
+    fecha = datetime.now()
+    nombre = f"rsvps_{fecha.strftime('%Y%m%d_%H%M%S')}.db"
+    final = os.path.join(carpeta, nombre)
+    tmp = os.path.join(carpeta, f".{nombre}.{os.getpid()}.tmp")
+
+    t0 = time.perf_counter()
+    origen = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        # Transacción de lectura abierta durante toda la copia (WAL):
+        # los pasos ven siempre la misma foto y nadie espera.
+        origen.execute("BEGIN")
+        filas = _contar_filas(origen)
+        total_paginas = origen.execute("PRAGMA page_count").fetchone()[0]
+        destino = sqlite3.connect(tmp)
+        try:
+            pasos = _copiar(origen, destino, paginas, pausa)
+        finally:
+            destino.close()
+        origen.execute("COMMIT")
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    finally:
+        origen.close()
+    duracion = time.perf_counter() - t0
+
+    # Archivo autocontenido: el header copiado dice WAL
+    con = sqlite3.connect(tmp)
+    con.execute("PRAGMA journal_mode=DELETE")
+    con.close()
+
+    meta = {
+        "archivo": nombre,
+        "fecha": fecha.isoformat(timespec="seconds"),
+        "origen": db_path,
+        "filas": filas,
+        "paginas": total_paginas,
+        "pasos": pasos,
+        "bytes": os.path.getsize(tmp),
+        "sha256": _sha256(tmp),
+        "duracion_ms": round(duracion * 1000, 1),
+    }
+
+    error = verificar_archivo(tmp, filas)
+    if error:
+        os.remove(tmp)
+        raise RuntimeError(f"El backup no pasó la verificación: {error}")
+
+    ultimo = next(iter(listar(carpeta)), None)
+    if ultimo and ultimo.get("sha256") == meta["sha256"]:
+        os.remove(tmp)
+        return {**ultimo, "sin_cambios": True}
+
+    # Dos en el mismo segundo: queda el más nuevo (también es una foto válida)
+    os.replace(tmp, final)
+    with open(_meta_path(final), "w") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=1)
+    return meta
+
+
+# ---------- Verificación y restore ----------
+
+
+def verificar_archivo(path: str, filas_esperadas: dict | None = None) -> str | None:
+    """None si está bien; si no, el motivo."""
+    try:
+        con = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            res = [r[0] for r in con.execute("PRAGMA integrity_check")]
+            if res != ["ok"]:
+                return "integrity_check: " + "; ".join(res[:5])
+            filas = _contar_filas(con)
+        finally:
+            con.close()
+    except sqlite3.Error as e:
+        return str(e)
+
+    if filas_esperadas is not None and filas != filas_esperadas:
+        distintas = sorted(
+            t
+            for t in set(filas) | set(filas_esperadas)
+            if filas.get(t) != filas_esperadas.get(t)
+        )
+        return "filas distintas en " + ", ".join(distintas)
+    return None
+
+
+def verificar(carpeta: str, nombre: str) -> str | None:
+    """Verifica un snapshot contra su meta (integridad, filas y sha256)."""
+    path = ruta_segura(carpeta, nombre)
+    if not path:
+        return "no existe"
+    meta = _leer_meta(path)
+    if meta.get("sha256") and _sha256(path) != meta["sha256"]:
+        return "sha256 distinto (archivo modificado o corrupto)"
+    return verificar_archivo(path, meta.get("filas"))
+
+
+def restaurar(carpeta: str, nombre: str, destino: str) -> dict:
+    """Copia un snapshot a `destino` (archivo nuevo) y verifica la copia.
+
+    No pisa la base en uso: se restaura al lado y se cambia a mano con la
+    app parada.
+    """
+    error = verificar(carpeta, nombre)
+    if error:
+        raise RuntimeError(f"{nombre}: {error}")
+    if os.path.exists(destino):
+        raise RuntimeError(f"{destino} ya existe")
+
+    path = ruta_segura(carpeta, nombre)
+    origen = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    nueva = sqlite3.connect(destino)
+    try:
+        origen.backup(nueva)
+    finally:
+        nueva.close()
+        origen.close()
+
+    meta = _leer_meta(path)
+    error = verificar_archivo(destino, meta.get("filas"))
+    if error:
+        raise RuntimeError(f"La copia restaurada no verifica: {error}")
+    return meta
+
+
+# ---------- Archivos y retención ----------
+
+
+def _leer_meta(path: str) -> dict:
+    try:
+        with open(_meta_path(path)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def listar(carpeta: str) -> list[dict]:
+    """Snapshots con su meta, del más nuevo al más viejo."""
+    if not os.path.isdir(carpeta):
+        return []
+    items = []
+    for nombre in os.listdir(carpeta):
+        if not _RE_NOMBRE.match(nombre):
+            continue
+        meta = _leer_meta(os.path.join(carpeta, nombre))
+        meta["archivo"] = nombre
+        items.append(meta)
+    items.sort(key=lambda m: m["archivo"], reverse=True)
+    return items
+
+
+def ruta_segura(carpeta: str, nombre: str) -> str | None:
+    if not _RE_NOMBRE.match(nombre or ""):
+        return None
+    path = os.path.join(carpeta, nombre)
+    return path if os.path.isfile(path) else None
+
+
+def borrar(carpeta: str, nombre: str):
+    path = ruta_segura(carpeta, nombre)
+    if path:
+        os.remove(path)
+        meta = _meta_path(path)
+        if os.path.exists(meta):
+            os.remove(meta)
+
+
+def a_conservar(nombres: list[str], ultimos: int, diarios: int, semanales: int) -> set:
+    """Qué snapshots quedan: los `ultimos` más nuevos, más el más nuevo de
+    cada uno de los últimos `diarios` días y `semanales` semanas."""
+    nombres = sorted(nombres, reverse=True)
+    quedan = set(nombres[:ultimos])
+    dias, semanas = {}, {}
+    for n in nombres:
+        f = datetime.strptime(n[len("rsvps_"):-len(".db")], "%Y%m%d_%H%M%S")
+        dias.setdefault(f.date(), n)
+        semanas.setdefault(f.isocalendar()[:2], n)
+    quedan.update(list(dias.values())[:diarios])
+    quedan.update(list(semanas.values())[:semanales])
+    return quedan
+
+
+def podar(carpeta: str, ultimos: int, diarios: int, semanales: int) -> list[str]:
+    nombres = [m["archivo"] for m in listar(carpeta)]
+    quedan = a_conservar(nombres, ultimos, diarios, semanales)
+    borrados = [n for n in nombres if n not in quedan]
+    for n in borrados:
+        borrar(carpeta, n)
+    return borrados
+
+
+class Candado:
+    """Un solo backup a la vez entre procesos (workers de gunicorn, CLI)."""
+
+    def __init__(self, carpeta: str):
+        os.makedirs(carpeta, exist_ok=True)
+        self.path = os.path.join(carpeta, ".lock")
+        self._f = None
+
+    def tomar(self) -> bool:
+        self._f = open(self.path, "a")
+        try:
+            fcntl.flock(self._f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            self._f.close()
+            self._f = None
+            return False
+
+    def soltar(self):
+        if self._f:
+            fcntl.flock(self._f, fcntl.LOCK_UN)
+            self._f.close()
+            self._f = None
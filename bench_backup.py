@@ -0,0 +1,165 @@
+"""
+Benchmark: cuánto se frena /enviar mientras corre un backup.
+
+Arma una base temporal con relleno (para que la copia dure algo), y mide la
+latencia de POST /enviar (test client de Flask, mismo proceso, como un
+worker de gunicorn con el backup corriendo en un hilo) en cuatro casos:
+
+  sin backup      línea de base
+  por pasos       backups.hacer_backup con BACKUP_PAGINAS / BACKUP_PAUSA_MS
+  de una          la API de backup en un solo paso, sin pausas
+  copia con lock  lo "ingenuo" pero consistente: BEGIN IMMEDIATE + copiar
+                  el archivo (frena a todos los que escriben)
+
+Uso:
+    python bench_backup.py [--filas 200000] [--segundos 3]
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+
+CARPETA = tempfile.mkdtemp(prefix="bench_backup_")
+os.environ["DB_PATH"] = os.path.join(CARPETA, "rsvps.db")
+os.environ["RATE_DB_PATH"] = os.path.join(CARPETA, "ratelimit.db")
+os.environ["BACKUP_DIR"] = os.path.join(CARPETA, "backups")
+os.environ.pop("DATABASE_URL", None)
+# que el limitador no se meta en la medición
+os.environ["RATE_ENVIAR_BURST"] = "1000000000"
+os.environ["SHED_MAX_COLA"] = "0"
+os.environ["SHED_MAX_ESPERA_MS"] = "0"
+
+import app as A  # noqa: E402
+import backups  # noqa: E402
+
+
+def preparar(filas: int):
+    with A.app.app_context():
+        A.init_db()
+        db = A.get_db()
+        db.executemany(
+            "INSERT INTO invitados (nombre) VALUES (?)",
+            [(f"Invitado {i:03d}",) for i in range(200)],
+        )
+        # relleno: respuestas viejas de otra gente, para que la base pese
+        db.executemany(
+            "INSERT INTO rsvps (nombre, confirma, menu, mensaje, created_at) "
+            "VALUES (?, 1, 'standard', ?, '2025-01-01T00:00:00')",
+            ((f"Relleno {i}", "x" * 120) for i in range(filas)),
+        )
+        db.commit()
+    return os.path.getsize(A.DB_PATH)
+
+
+def medir(cliente, segundos: float, fondo=None) -> dict:
+    """Latencias de /enviar durante `segundos`, con `fondo` corriendo en loop."""
+    parar = threading.Event()
+    vueltas = [0]
+
+    def loop():
+        while not parar.is_set():
+            fondo()
+            vueltas[0] += 1
+            parar.wait(0.1)  # un respiro entre backup y backup
+
+    hilo = None
+    if fondo:
+        hilo = threading.Thread(target=loop, daemon=True)
+        hilo.start()
+        time.sleep(0.05)
+
+    lat, i, errores = [], 0, 0
+    fin = time.perf_counter() + segundos
+    while time.perf_counter() < fin:
+        t0 = time.perf_counter()
+        r = cliente.post(
+            "/enviar",
+            data={
+                "nombre": f"Invitado {i % 200:03d}",
+                "confirma": "si",
+                "menu": "veggie" if i % 2 else "standard",
+            },
+        )
+        lat.append((time.perf_counter() - t0) * 1000)
+        errores += r.status_code != 303 or "/gracias" not in r.location
+        i += 1
+
+    parar.set()
+    if hilo:
+        hilo.join()
+    lat.sort()
+    pct = lambda p: lat[min(len(lat) - 1, int(len(lat) * p))]  # noqa: E731
+    return {
+        "pedidos": len(lat),
+        "errores": errores,
+        "backups": vueltas[0],
+        "p50": statistics.median(lat),
+        "p95": pct(0.95),
+        "p99": pct(0.99),
+        "max": lat[-1],
+    }
+
+
+def copia_con_lock():
+    con = sqlite3.connect(A.DB_PATH, isolation_level=None, timeout=30)
+    try:
+        con.execute("BEGIN IMMEDIATE")
+        # en WAL lo último está en el -wal: hay que llevarse los dos
+        shutil.copyfile(A.DB_PATH, os.path.join(CARPETA, "copia.db"))
+        if os.path.exists(A.DB_PATH + "-wal"):
+            shutil.copyfile(A.DB_PATH + "-wal", os.path.join(CARPETA, "copia.db-wal"))
+        con.execute("COMMIT")
+    finally:
+        con.close()
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    ap.add_argument("--filas", type=int, default=200_000, help="filas de relleno")
+    ap.add_argument("--segundos", type=float, default=3.0, help="por caso")
+    args = ap.parse_args()
+
+    peso = preparar(args.filas)
+    print(f"Base: {peso / 1e6:.1f} MB en {CARPETA}")
+    print(
+        f"Backup por pasos: {A.BACKUP_PAGINAS} páginas/paso, "
+        f"{A.BACKUP_PAUSA_MS} ms de pausa\n"
+    )
+
+    destino = os.path.join(CARPETA, "snap")
+    casos = [
+        ("sin backup", None),
+        (
+            "por pasos",
+            lambda: backups.hacer_backup(
+                A.DB_PATH, destino, A.BACKUP_PAGINAS, A.BACKUP_PAUSA_MS / 1000
+            ),
+        ),
+        ("de una", lambda: backups.hacer_backup(A.DB_PATH, destino, -1, 0)),
+        ("copia con lock", copia_con_lock),
+    ]
+
+    cliente = A.app.test_client()
+    print(
+        f"{'caso':<16}{'pedidos':>8}{'errores':>8}{'backups':>8}"
+        f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'máx ms':>9}"
+    )
+    for nombre, fondo in casos:
+        r = medir(cliente, args.segundos, fondo)
+        print(
+            f"{nombre:<16}{r['pedidos']:>8}{r['errores']:>8}{r['backups']:>8}"
+            f"{r['p50']:>9.2f}{r['p95']:>9.2f}{r['p99']:>9.2f}{r['max']:>9.2f}"
+        )
+        # entre caso y caso, que los snapshots no se acumulen
+        for item in backups.listar(destino):
+            backups.borrar(destino, item["archivo"])
+
+    shutil.rmtree(CARPETA, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+"""
+Profiler a pedido para requests puntuales.
+
+Un hilo muestrea la pila del request cada pocos milisegundos (sirve para
+flamegraphs de verdad, con pilas completas). Además se miden exactas las
+consultas SQL (envolviendo la conexión de get_db) y los templates de Jinja.
+El resultado se guarda en formato speedscope (https://www.speedscope.app)
+y se puede bajar también como "folded stacks" para flamegraph.pl.
+"""
+import json
+import os
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+
+
+class Perfil:
+    def __init__(self, metodo: str, ruta: str, intervalo: float):
+        self.metodo = metodo
+        self.ruta = ruta
+        self.intervalo = intervalo
+        self.inicio = time.perf_counter()
+        self.fecha = datetime.now()
+        self.muestras = []  # (t, pila)
+        self.sql = {}  # sql normalizado -> [cantidad, segundos, máx]
+        self.sql_actual = None
+        self.templates = {}  # nombre -> [cantidad, segundos]
+        self._template_inicio = {}
+        self._tid = threading.get_ident()
+        self._parar = threading.Event()
+        self._hilo = threading.Thread(target=self._muestrear, daemon=True)
+
+    # ----- muestreo -----
+
+    def empezar(self):
+        self._hilo.start()
+
+    def _muestrear(self):
+        while not self._parar.wait(self.intervalo):
+            frame = sys._current_frames().get(self._tid)
+            pila = []
+            while frame is not None:
+                code = frame.f_code
+                pila.append((code.co_name, code.co_filename, code.co_firstlineno))
+                frame = frame.f_back
+            pila.reverse()
+            sql = self.sql_actual
+            if sql:
+                pila.append((f"SQL: {sql[:80]}", "<sql>", 0))
+            self.muestras.append((time.perf_counter(), tuple(pila)))
+
+    def terminar(self):
+        self._parar.set()
+        self._hilo.join()
+        self.duracion = time.perf_counter() - self.inicio
+
+    # ----- SQL y templates -----
+
+    def registrar_sql(self, sql: str, segundos: float, nueva: bool = True):
+        clave = " ".join(sql.split())
+        d = self.sql.setdefault(clave, [0, 0.0, 0.0])
+        d[0] += int(nueva)
+        d[1] += segundos
+        d[2] = max(d[2], segundos)
+
+    def template_empieza(self, nombre: str):
+        self._template_inicio[nombre] = time.perf_counter()
+
+    def template_termina(self, nombre: str):
+        t0 = self._template_inicio.pop(nombre, None)
+        if t0 is None:
+            return
+        d = self.templates.setdefault(nombre, [0, 0.0])
+        d[0] += 1
+        d[1] += time.perf_counter() - t0
+
+    # ----- resultados -----
+
+    def _tiempo_en(self, fragmento: str) -> float:
+        """Tiempo estimado (por muestras) con algún frame de ese paquete."""
+        total, previo = 0.0, self.inicio
+        for t, pila in self.muestras:
+            if any(fragmento in f[1] for f in pila):
+                total += t - previo
+            previo = t
+        return total
+
+    def resumen(self) -> dict:
+        sql_total = sum(d[1] for d in self.sql.values())
+        return {
+            "fecha": self.fecha.isoformat(timespec="seconds"),
+            "metodo": self.metodo,
+            "ruta": self.ruta,
+            "duracion_ms": round(self.duracion * 1000, 1),
+            "muestras": len(self.muestras),
+            "intervalo_ms": round(self.intervalo * 1000, 2),
+            "sql_ms": round(sql_total * 1000, 1),
+            "sql_consultas": sum(d[0] for d in self.sql.values()),
+            "jinja_ms": round(sum(d[1] for d in self.templates.values()) * 1000, 1),
+            "openpyxl_ms": round(self._tiempo_en(f"{os.sep}openpyxl{os.sep}") * 1000, 1),
+            "sql": sorted(
+                (
+                    {
+                        "sql": sql,
+                        "cantidad": d[0],
+                        "total_ms": round(d[1] * 1000, 2),
+                        "max_ms": round(d[2] * 1000, 2),
+                    }
+                    for sql, d in self.sql.items()
+                ),
+                key=lambda x: -x["total_ms"],
+            ),
+            "templates": {
+                n: {"cantidad": d[0], "total_ms": round(d[1] * 1000, 2)}
+                for n, d in self.templates.items()
+            },
+        }
+
+    def speedscope(self) -> dict:
+        frames, indices = [], {}
+        samples, weights = [], []
+        previo = self.inicio
+        for t, pila in self.muestras:
+            fila = []
+            for f in pila:
+                if f not in indices:
+                    indices[f] = len(frames)
+                    frames.append({"name": f[0], "file": f[1], "line": f[2]})
+                fila.append(indices[f])
+            samples.append(fila)
+            weights.append(t - previo)
+            previo = t
+        nombre = f"{self.metodo} {self.ruta}"
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": frames},
+            "profiles": [
+                {
+                    "type": "sampled",
+                    "name": nombre,
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": sum(weights),
+                    "samples": samples,
+                    "weights": weights,
+                }
+            ],
+            "name": nombre,
+            "exporter": "post_civil",
+        }
+
+
+class CursorMedido:
+    """El fetch también cuenta: en SQLite el execute sólo trae la 1ra fila."""
+
+    def __init__(self, cur, perfil, sql):
+        self._cur = cur
+        self._perfil = perfil
+        self._sql = sql
+
+    def _medir(self, metodo, *args, nueva=False):
+        t0 = time.perf_counter()
+        self._perfil.sql_actual = self._sql
+        try:
+            return getattr(self._cur, metodo)(*args)
+        finally:
+            self._perfil.sql_actual = None
+            self._perfil.registrar_sql(
+                self._sql, time.perf_counter() - t0, nueva=nueva
+            )
+
+    def execute(self, *args):
+        # Sólo lo usa storage.stream(), que recibe el cursor sin ejecutar
+        return self._medir("execute", *args, nueva=True)
+
+    def fetchone(self):
+        return self._medir("fetchone")
+
+    def fetchall(self):
+        return self._medir("fetchall")
+
+    def fetchmany(self, *args):
+        return self._medir("fetchmany", *args)
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def __getattr__(self, nombre):
+        return getattr(self._cur, nombre)
+
+
+class ConexionMedida:
+    """Envuelve la conexión de get_db() y mide cada consulta."""
+
+    def __init__(self, con, perfil: Perfil):
+        self._con = con
+        self._perfil = perfil
+
+    def _medir(self, metodo, sql, params):
+        t0 = time.perf_counter()
+        self._perfil.sql_actual = sql
+        try:
+            cur = getattr(self._con, metodo)(sql, params)
+        finally:
+            self._perfil.sql_actual = None
+            self._perfil.registrar_sql(sql, time.perf_counter() - t0)
+        return CursorMedido(cur, self._perfil, sql)
+
+    def execute(self, sql, params=()):
+        return self._medir("execute", sql, params)
+
+    def executemany(self, sql, seq):
+        return self._medir("executemany", sql, seq)
+
+    def __getattr__(self, nombre):
+        return getattr(self._con, nombre)
+
+
+# ---------- Archivos ----------
+
+_RE_NOMBRE = re.compile(r"^[\w.-]+\.speedscope\.json$")
+
+
+def guardar(perfil: Perfil, carpeta: str, maximo: int) -> str:
+    os.makedirs(carpeta, exist_ok=True)
+    slug = re.sub(r"[^\w]+", "-", perfil.ruta).strip("-") or "raiz"
+    base = (
+        f"{perfil.fecha.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}_"
+        f"{perfil.metodo}_{slug[:40]}_{int(perfil.duracion * 1000)}ms"
+    )
+    with open(os.path.join(carpeta, f"{base}.speedscope.json"), "w") as f:
+        json.dump(perfil.speedscope(), f)
+    with open(os.path.join(carpeta, f"{base}.meta.json"), "w") as f:
+        json.dump(perfil.resumen(), f, ensure_ascii=False, indent=1)
+
+    # retención: sólo los últimos `maximo`
+    for viejo in listar(carpeta)[maximo:]:
+        borrar(carpeta, viejo["archivo"])
+    return f"{base}.speedscope.json"
+
+
+def listar(carpeta: str) -> list[dict]:
+    if not os.path.isdir(carpeta):
+        return []
+    items = []
+    for nombre in os.listdir(carpeta):
+        if not _RE_NOMBRE.match(nombre):
+            continue
+        meta_path = os.path.join(
+            carpeta, nombre.replace(".speedscope.json", ".meta.json")
+        )
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = {}
+        meta["archivo"] = nombre
+        items.append(meta)
+    items.sort(key=lambda m: m["archivo"], reverse=True)
+    return items
+
+
+def ruta_segura(carpeta: str, nombre: str) -> str | None:
+    if not _RE_NOMBRE.match(nombre or ""):
+        return None
+    path = os.path.join(carpeta, nombre)
+    return path if os.path.isfile(path) else None
+
+
+def borrar(carpeta: str, nombre: str):
+    path = ruta_segura(carpeta, nombre)
+    if path:
+        os.remove(path)
+        meta = path.replace(".speedscope.json", ".meta.json")
+        if os.path.exists(meta):
+            os.remove(meta)
+
+
+def a_folded(speedscope: dict) -> str:
+    """Formato 'folded stacks' (flamegraph.pl / inferno), en microsegundos."""
+    frames = speedscope["shared"]["frames"]
+    acum = {}
+    for prof in speedscope["profiles"]:
+        for fila, peso in zip(prof["samples"], prof["weights"]):
+            pila = ";".join(
+                f"{frames[i]['name']} ({os.path.basename(frames[i]['file'])})"
+                for i in fila
+            )
+            acum[pila] = acum.get(pila, 0) + peso
+    return "".join(
+        f"{pila} {max(1, round(peso * 1e6))}\n" for pila, peso in acum.items() if pila
+    )
@@ -100,4 +100,70 @@ document.addEventListener("DOMContentLoaded", () => {
       }
     });
   }
+
+  // ---------- Clave de idempotencia ----------
+  // Si el envío se reintenta (doble click, cola offline) el server lo cuenta una vez
+  const nuevaClave = () => (window.crypto && crypto.randomUUID)
+    ? crypto.randomUUID()
+    : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 12)}`;
+  if (form && !form.querySelector('input[name="idempotency_key"]')) {
+    const clave = document.createElement("input");
+    clave.type = "hidden";
+    clave.name = "idempotency_key";
+    clave.value = nuevaClave();
+    form.appendChild(clave);
+    // Volver con "atrás" a una página que ya se envió la restaura del bfcache
+    // con la misma clave: la respuesta corregida se tomaría como duplicada.
+    window.addEventListener("pageshow", (ev) => {
+      if (ev.persisted) clave.value = nuevaClave();
+    });
+  }
+
+  // ---------- Confirmaciones sin conexión que el server rechazó ----------
+  // Al invitado le dijimos que estaba guardada: se le avisa y se le deja el
+  // formulario cargado con lo que había puesto para que la corrija.
+  if (form && inputNombre && window.RsvpCola && window.indexedDB) {
+    RsvpCola.rechazadas().then((items) => {
+      if (!items.length) return;
+      const item = items[items.length - 1];
+      inputNombre.value = item.nombre || "";
+      if (si && no) {
+        si.checked = item.confirma === "si";
+        no.checked = item.confirma === "no";
+        syncMenu();
+      }
+      if (menu && item.menu) menu.value = item.menu;
+      const mensaje = form.querySelector('[name="mensaje"]');
+      if (mensaje) mensaje.value = item.mensaje || "";
+
+      const texto = `${item.rechazo} Revisá los datos y volvé a enviarla.`;
+      if (window.Swal) {
+        Swal.fire({
+          icon: "warning",
+          title: "No pudimos guardar tu confirmación",
+          text: texto,
+          confirmButtonText: "Entendido"
+        });
+      } else {
+        alert(`No pudimos guardar tu confirmación. ${texto}`);
+      }
+      items.forEach((i) => RsvpCola.borrar(i.idempotency_key));
+    }).catch((e) => console.error("No se pudo leer la cola:", e));
+  }
 });
+
+// ---------- Service worker (modo sin conexión) ----------
+if ("serviceWorker" in navigator) {
+  const vaciarCola = () => {
+    if (navigator.serviceWorker.controller) {
+      navigator.serviceWorker.controller.postMessage({ tipo: "vaciar-cola" });
+    }
+  };
+  window.addEventListener("load", () => {
+    navigator.serviceWorker.register("/sw.js")
+      .then(() => navigator.serviceWorker.ready)
+      .then(vaciarCola)
+      .catch(e => console.error("No se pudo registrar el service worker:", e));
+  });
+  window.addEventListener("online", vaciarCola);
+}
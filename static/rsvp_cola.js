@@ -0,0 +1,94 @@
+// Cola de confirmaciones hechas sin conexión (IndexedDB).
+// La usan el service worker (importScripts) y main.js.
+(function (global) {
+  const DB_NOMBRE = "casorio";
+  const STORE = "rsvp_cola";
+
+  function abrir() {
+    return new Promise((resolve, reject) => {
+      const req = indexedDB.open(DB_NOMBRE, 1);
+      req.onupgradeneeded = () => {
+        req.result.createObjectStore(STORE, { keyPath: "idempotency_key" });
+      };
+      req.onsuccess = () => resolve(req.result);
+      req.onerror = () => reject(req.error);
+    });
+  }
+
+  async function tx(modo, fn) {
+    const db = await abrir();
+    return new Promise((resolve, reject) => {
+      const t = db.transaction(STORE, modo);
+      const res = fn(t.objectStore(STORE));
+      t.oncomplete = () => { db.close(); resolve(res && res.result); };
+      t.onerror = () => { db.close(); reject(t.error); };
+    });
+  }
+
+  function nuevaClave() {
+    if (global.crypto && crypto.randomUUID) return crypto.randomUUID();
+    return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 12)}`;
+  }
+
+  const RsvpCola = {
+    nuevaClave,
+
+    // datos: objeto plano con los campos del formulario
+    agregar(datos) {
+      const item = { ...datos };
+      if (!item.idempotency_key) item.idempotency_key = nuevaClave();
+      item.guardado = new Date().toISOString();
+      return tx("readwrite", (s) => s.put(item));
+    },
+
+    todos() {
+      return tx("readonly", (s) => s.getAll());
+    },
+
+    borrar(clave) {
+      return tx("readwrite", (s) => s.delete(clave));
+    },
+
+    // Las que el server rechazó: se le muestran al invitado en la próxima
+    // visita (ya le dijimos "guardamos tu respuesta") para que la corrija.
+    async rechazadas() {
+      return (await RsvpCola.todos()).filter((item) => item.rechazo);
+    },
+
+    // Reenvía lo pendiente, con la hora en que se llenó (`guardado`) para
+    // que el server no la ponga encima de una respuesta más nueva. Se borra
+    // lo que el server aceptó; lo rechazado por datos inválidos queda
+    // marcado con el motivo; lo demás queda para después.
+    async vaciar() {
+      const items = await RsvpCola.todos();
+      let enviados = 0;
+      for (const item of items) {
+        if (item.rechazo) continue;
+        let res;
+        try {
+          res = await fetch("/enviar", {
+            method: "POST",
+            body: new URLSearchParams(item),
+            headers: { Accept: "application/json" },
+            credentials: "same-origin",
+          });
+        } catch (e) {
+          break; // sin conexión todavía
+        }
+        if (res.ok) {
+          await RsvpCola.borrar(item.idempotency_key);
+          enviados += 1;
+        } else if (res.status === 400) {
+          const data = await res.json().catch(() => ({}));
+          const motivo = (data.errors || []).join(" ") || "La confirmación no es válida.";
+          await tx("readwrite", (s) => s.put({ ...item, rechazo: motivo }));
+        } else {
+          break; // 429 / 5xx: reintentar más tarde
+        }
+      }
+      return enviados;
+    },
+  };
+
+  global.RsvpCola = RsvpCola;
+})(self);
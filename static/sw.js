@@ -0,0 +1,136 @@
+// Service worker de la invitación: deja usable el formulario con mala señal.
+// - Páginas: primero red, si falla lo último guardado.
+// - Estáticos y CDN: primero caché.
+// - /api/invitados: primero red; sin red, se filtra lo ya visto.
+// - POST /enviar sin red: se guarda en IndexedDB y se reenvía después.
+importScripts("/static/rsvp_cola.js");
+
+const CACHE = "casorio-v4";
+const PAGINAS = ["/", "/confirmar", "/gracias"];
+const ESTATICOS = [
+  "/static/main.js?v=8",
+  "/static/rsvp_cola.js",
+  "/static/styles.css?v=9",
+  "/static/invitacion_casamiento.png",
+];
+const CDN = [
+  "https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/css/bootstrap.min.css",
+  "https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/js/bootstrap.bundle.min.js",
+  "https://cdn.jsdelivr.net/npm/sweetalert2@11",
+  "https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css",
+];
+
+self.addEventListener("install", (ev) => {
+  ev.waitUntil((async () => {
+    const cache = await caches.open(CACHE);
+    await cache.addAll([...PAGINAS, ...ESTATICOS]);
+    // Los de CDN pueden venir opacos: de a uno y sin frenar la instalación
+    await Promise.all(CDN.map(async (url) => {
+      try {
+        const res = await fetch(new Request(url, { mode: "no-cors" }));
+        await cache.put(url, res);
+      } catch (e) {
+        console.warn("No se pudo precachear", url, e);
+      }
+    }));
+    await self.skipWaiting();
+  })());
+});
+
+self.addEventListener("activate", (ev) => {
+  ev.waitUntil((async () => {
+    for (const nombre of await caches.keys()) {
+      if (nombre !== CACHE) await caches.delete(nombre);
+    }
+    await self.clients.claim();
+  })());
+});
+
+async function primeroRed(req, opciones = {}) {
+  const cache = await caches.open(CACHE);
+  try {
+    const res = await fetch(req);
+    if (res.ok) cache.put(req, res.clone());
+    return res;
+  } catch (e) {
+    const guardada = await cache.match(req, opciones);
+    if (guardada) return guardada;
+    throw e;
+  }
+}
+
+async function primeroCache(req) {
+  const cache = await caches.open(CACHE);
+  const guardada = await cache.match(req);
+  if (guardada) return guardada;
+  const res = await fetch(req);
+  if (res.ok || res.type === "opaque") cache.put(req, res.clone());
+  return res;
+}
+
+// Sin red: junta los nombres de todas las búsquedas ya hechas y filtra
+async function invitadosSinRed(req) {
+  const cache = await caches.open(CACHE);
+  const exacta = await cache.match(req);
+  if (exacta) return exacta;
+
+  const q = (new URL(req.url).searchParams.get("q") || "").toLowerCase();
+  const nombres = new Set();
+  for (const k of await cache.keys()) {
+    if (new URL(k.url).pathname !== "/api/invitados") continue;
+    try {
+      const data = await (await cache.match(k)).json();
+      (data.items || []).forEach((n) => nombres.add(n));
+    } catch (e) { /* respuesta vieja o rota: se ignora */ }
+  }
+  const items = [...nombres]
+    .filter((n) => q.length >= 4 && n.toLowerCase().includes(q))
+    .sort()
+    .slice(0, 5);
+  return new Response(JSON.stringify({ ok: true, items, offline: true }), {
+    headers: { "Content-Type": "application/json" },
+  });
+}
+
+async function enviarOGuardar(req) {
+  const copia = req.clone();
+  try {
+    return await fetch(req);
+  } catch (e) {
+    const datos = Object.fromEntries(new URLSearchParams(await copia.text()));
+    await RsvpCola.agregar(datos);
+    try {
+      await self.registration.sync.register("rsvp-cola");
+    } catch (err) { /* sin Background Sync: reintenta main.js al volver la red */ }
+    return Response.redirect("/gracias?offline=1", 303);
+  }
+}
+
+self.addEventListener("fetch", (ev) => {
+  const req = ev.request;
+  const url = new URL(req.url);
+  const propio = url.origin === self.location.origin;
+
+  if (propio && req.method === "POST" && url.pathname === "/enviar") {
+    ev.respondWith(enviarOGuardar(req));
+    return;
+  }
+  if (req.method !== "GET") return;
+
+  if (propio && url.pathname === "/api/invitados") {
+    ev.respondWith(primeroRed(req).catch(() => invitadosSinRed(req)));
+  } else if (propio && PAGINAS.includes(url.pathname) && req.mode === "navigate") {
+    ev.respondWith(primeroRed(req, { ignoreSearch: true }));
+  } else if ((propio && url.pathname.startsWith("/static/")) || CDN.some((c) => req.url.startsWith(c.split("?")[0]))
+             || url.hostname === "fonts.googleapis.com" || url.hostname === "fonts.gstatic.com") {
+    ev.respondWith(primeroCache(req));
+  }
+});
+
+self.addEventListener("sync", (ev) => {
+  if (ev.tag === "rsvp-cola") ev.waitUntil(RsvpCola.vaciar());
+});
+
+self.addEventListener("message", (ev) => {
+  if (ev.data && ev.data.tipo === "vaciar-cola") ev.waitUntil(RsvpCola.vaciar());
+});
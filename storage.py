@@ -0,0 +1,549 @@
+"""
+Backends de almacenamiento: SQLite (un archivo en el volumen) o PostgreSQL
+(para correr más de una máquina).
+
+Las consultas de app.py se escriben una sola vez, con placeholders `?` o
+`:nombre` y SQL que entienden los dos motores. Para SQLite se usa la
+conexión de sqlite3 tal cual; para Postgres, `ConexionPG` traduce los
+placeholders y devuelve filas que se usan igual que sqlite3.Row.
+
+Se elige con DATABASE_URL (postgres://...); si no está, SQLite en DB_PATH.
+El límite de pedidos (app.py) sigue en un SQLite local a cada máquina.
+"""
+import os
+import re
+import sqlite3
+from datetime import datetime
+
+try:
+    import psycopg
+except ImportError:  # sólo hace falta con DATABASE_URL
+    psycopg = None
+
+
+ERRORES_INTEGRIDAD = (sqlite3.IntegrityError,) + (
+    (psycopg.IntegrityError,) if psycopg else ()
+)
+
+
+# =========================
+# ===      SQLITE       ===
+# =========================
+
+SCHEMA_SQLITE = [
+    """
+    CREATE TABLE IF NOT EXISTS rsvps (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nombre TEXT NOT NULL,
+        confirma INTEGER NOT NULL,
+        menu TEXT,
+        mensaje TEXT,
+        created_at TEXT NOT NULL,
+        updated_at TEXT
+    )
+    """,
+    # --- HISTORIAL COMPACTADO DE RSVPs ---
+    # Cada fila guarda, comprimidas (zlib + JSON), las respuestas viejas
+    # de un invitado que se sacaron de `rsvps` en una corrida de compactación.
+    """
+    CREATE TABLE IF NOT EXISTS rsvps_archivo (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nombre TEXT NOT NULL,
+        cantidad INTEGER NOT NULL,
+        payload BLOB NOT NULL,
+        archived_at TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_rsvps_archivo_nombre
+    ON rsvps_archivo(nombre)
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS invitados (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nombre TEXT UNIQUE NOT NULL,
+        updated_at TEXT
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_rsvps_nombre_created
+    ON rsvps(nombre, created_at)
+    """,
+    # Claves de idempotencia de /enviar (reenvíos del modo sin conexión)
+    """
+    CREATE TABLE IF NOT EXISTS rsvp_idempotencia (
+        clave TEXT PRIMARY KEY,
+        created_at TEXT NOT NULL
+    )
+    """,
+    # --- ROLLUPS DE RSVPs (ver app.py, "ROLLUPS RSVPs") ---
+    """
+    CREATE TABLE IF NOT EXISTS rsvp_rollup_hora (
+        bucket TEXT PRIMARY KEY,
+        respuestas INTEGER NOT NULL DEFAULT 0,
+        confirmados INTEGER NOT NULL DEFAULT 0,
+        declinados INTEGER NOT NULL DEFAULT 0,
+        standard INTEGER NOT NULL DEFAULT 0,
+        veggie INTEGER NOT NULL DEFAULT 0,
+        pendientes INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS rsvp_rollup_dia (
+        bucket TEXT PRIMARY KEY,
+        respuestas INTEGER NOT NULL DEFAULT 0,
+        confirmados INTEGER NOT NULL DEFAULT 0,
+        declinados INTEGER NOT NULL DEFAULT 0,
+        standard INTEGER NOT NULL DEFAULT 0,
+        veggie INTEGER NOT NULL DEFAULT 0,
+        pendientes INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    # --- BORRADOS (tombstones para la API de datos con since=) ---
+    # Filas que salieron de un dataset: ver app.py, "API DE DATOS".
+    """
+    CREATE TABLE IF NOT EXISTS borrados (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        tabla TEXT NOT NULL,
+        fila_id INTEGER NOT NULL,
+        deleted_at TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_borrados_tabla
+    ON borrados(tabla, deleted_at)
+    """,
+    # --- TABLA GASTOS ---
+    """
+    CREATE TABLE IF NOT EXISTS gastos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        concepto TEXT NOT NULL,
+        tipo TEXT NOT NULL CHECK(tipo IN ('por_invitado', 'total')),
+        monto_cent INTEGER NOT NULL,
+        notas TEXT,
+        created_at TEXT NOT NULL,
+        updated_at TEXT
+    )
+    """,
+]
+
+# invitados no tiene created_at (rsvps y gastos caen ahí, ver DATASETS en
+# app.py): las filas de antes de updated_at toman la hora de la migración,
+# si no con since= no salían nunca.
+RELLENAR_UPDATED_AT = (
+    "UPDATE invitados SET updated_at = ? WHERE updated_at IS NULL"
+)
+
+# Versión de los datos de gastos (para cachear cálculos derivados).
+# Van después de la migración porque DROP TABLE se lleva los triggers.
+SCHEMA_SQLITE_VERSION = [
+    """
+    CREATE TABLE IF NOT EXISTS datos_version (
+        tabla TEXT PRIMARY KEY,
+        version INTEGER NOT NULL
+    )
+    """,
+    """
+    INSERT INTO datos_version (tabla, version) VALUES ('gastos', 0)
+    ON CONFLICT DO NOTHING
+    """,
+] + [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS gastos_version_{evento.lower()}
+    AFTER {evento} ON gastos
+    BEGIN
+        UPDATE datos_version SET version = version + 1
+         WHERE tabla = 'gastos';
+    END
+    """
+    for evento in ("INSERT", "UPDATE", "DELETE")
+]
+
+
+def migrar_gastos_a_centavos(db):
+    """
+    Migra `gastos.monto` (REAL) a `gastos.monto_cent` (INTEGER).
+    Se corre una sola vez; con dos workers el BEGIN IMMEDIATE serializa
+    y el segundo ve la columna nueva y no hace nada.
+    """
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        cols = {r["name"] for r in db.execute("PRAGMA table_info(gastos)")}
+        if "monto_cent" in cols:
+            db.rollback()
+            return
+        db.execute(
+            """
+            CREATE TABLE gastos_cent (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                concepto TEXT NOT NULL,
+                tipo TEXT NOT NULL CHECK(tipo IN ('por_invitado', 'total')),
+                monto_cent INTEGER NOT NULL,
+                notas TEXT,
+                created_at TEXT NOT NULL
+            )
+        """
+        )
+        db.execute(
+            """
+            INSERT INTO gastos_cent
+                (id, concepto, tipo, monto_cent, notas, created_at)
+            SELECT id, concepto, tipo,
+                   CAST(ROUND(COALESCE(monto, 0) * 100) AS INTEGER),
+                   notas, created_at
+            FROM gastos
+            """
+        )
+        db.execute("DROP TABLE gastos")
+        db.execute("ALTER TABLE gastos_cent RENAME TO gastos")
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+
+class SQLiteStorage:
+    motor = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        self.nombre = f"sqlite:{path}"
+
+    def conectar(self):
+        con = sqlite3.connect(self.path)
+        con.row_factory = sqlite3.Row
+        return con
+
+    def init_schema(self, db):
+        # WAL (queda grabado en el archivo): los lectores no frenan a los que
+        # escriben, y el backup en caliente puede leer una foto fija (backups.py)
+        db.execute("PRAGMA journal_mode=WAL")
+        for sql in SCHEMA_SQLITE:
+            db.execute(sql)
+        db.commit()
+
+        # Bases viejas: monto REAL -> monto_cent INTEGER
+        cols = {r["name"] for r in db.execute("PRAGMA table_info(gastos)")}
+        if "monto_cent" not in cols:
+            migrar_gastos_a_centavos(db)
+
+        # Bases creadas antes de que existiera updated_at
+        for tabla in ("rsvps", "invitados", "gastos"):
+            cols = {r["name"] for r in db.execute(f"PRAGMA table_info({tabla})")}
+            if "updated_at" not in cols:
+                try:
+                    db.execute(f"ALTER TABLE {tabla} ADD COLUMN updated_at TEXT")
+                except sqlite3.OperationalError as e:
+                    # otro worker la agregó entre el PRAGMA y el ALTER
+                    if "duplicate column" not in str(e):
+                        raise
+        ahora = datetime.now().isoformat(timespec="seconds")
+        db.execute(RELLENAR_UPDATED_AT, (ahora,))
+
+        for sql in SCHEMA_SQLITE_VERSION:
+            db.execute(sql)
+        db.commit()
+
+    def bloquear_rsvps(self, db):
+        # Toma ya el lock de escritura de la base, antes de leer el historial
+        # que se usa para los rollups (sqlite3 sólo abre la transacción en
+        # el primer INSERT/UPDATE, y dos escrituras podían leer lo mismo).
+        if not db.in_transaction:
+            db.execute("BEGIN IMMEDIATE")
+
+    def stream(self, sql: str, params=(), chunk: int = 500, envolver=None):
+        # Conexión propia: la del request se cierra antes de que termine
+        # de recorrerse el cursor. `envolver` recibe el cursor antes del
+        # execute (lo usa el profiler, ver app.stream_db).
+        con = sqlite3.connect(self.path)
+        try:
+            cur = con.cursor()
+            if envolver is not None:
+                cur = envolver(cur)
+            cur.execute(sql, params)
+            while True:
+                filas = cur.fetchmany(chunk)
+                if not filas:
+                    break
+                yield from filas
+        finally:
+            con.close()
+
+
+# =========================
+# ===     POSTGRES      ===
+# =========================
+
+SCHEMA_POSTGRES = [
+    """
+    CREATE TABLE IF NOT EXISTS rsvps (
+        id BIGSERIAL PRIMARY KEY,
+        nombre TEXT NOT NULL,
+        confirma INTEGER NOT NULL,
+        menu TEXT,
+        mensaje TEXT,
+        created_at TEXT NOT NULL,
+        updated_at TEXT
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_rsvps_nombre_created
+    ON rsvps(nombre, created_at)
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS rsvps_archivo (
+        id BIGSERIAL PRIMARY KEY,
+        nombre TEXT NOT NULL,
+        cantidad INTEGER NOT NULL,
+        payload BYTEA NOT NULL,
+        archived_at TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_rsvps_archivo_nombre
+    ON rsvps_archivo(nombre)
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS invitados (
+        id BIGSERIAL PRIMARY KEY,
+        nombre TEXT UNIQUE NOT NULL,
+        updated_at TEXT
+    )
+    """,
+    # Claves de idempotencia de /enviar (reenvíos del modo sin conexión)
+    """
+    CREATE TABLE IF NOT EXISTS rsvp_idempotencia (
+        clave TEXT PRIMARY KEY,
+        created_at TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS rsvp_rollup_hora (
+        bucket TEXT PRIMARY KEY,
+        respuestas INTEGER NOT NULL DEFAULT 0,
+        confirmados INTEGER NOT NULL DEFAULT 0,
+        declinados INTEGER NOT NULL DEFAULT 0,
+        standard INTEGER NOT NULL DEFAULT 0,
+        veggie INTEGER NOT NULL DEFAULT 0,
+        pendientes INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS rsvp_rollup_dia (
+        bucket TEXT PRIMARY KEY,
+        respuestas INTEGER NOT NULL DEFAULT 0,
+        confirmados INTEGER NOT NULL DEFAULT 0,
+        declinados INTEGER NOT NULL DEFAULT 0,
+        standard INTEGER NOT NULL DEFAULT 0,
+        veggie INTEGER NOT NULL DEFAULT 0,
+        pendientes INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS gastos (
+        id BIGSERIAL PRIMARY KEY,
+        concepto TEXT NOT NULL,
+        tipo TEXT NOT NULL CHECK(tipo IN ('por_invitado', 'total')),
+        monto_cent BIGINT NOT NULL,
+        notas TEXT,
+        created_at TEXT NOT NULL,
+        updated_at TEXT
+    )
+    """,
+    # --- BORRADOS (tombstones para la API de datos con since=) ---
+    # Filas que salieron de un dataset: ver app.py, "API DE DATOS".
+    """
+    CREATE TABLE IF NOT EXISTS borrados (
+        id BIGSERIAL PRIMARY KEY,
+        tabla TEXT NOT NULL,
+        fila_id BIGINT NOT NULL,
+        deleted_at TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_borrados_tabla
+    ON borrados(tabla, deleted_at)
+    """,
+    # Bases creadas antes de que existiera updated_at
+    "ALTER TABLE rsvps ADD COLUMN IF NOT EXISTS updated_at TEXT",
+    "ALTER TABLE invitados ADD COLUMN IF NOT EXISTS updated_at TEXT",
+    "ALTER TABLE gastos ADD COLUMN IF NOT EXISTS updated_at TEXT",
+    """
+    CREATE TABLE IF NOT EXISTS datos_version (
+        tabla TEXT PRIMARY KEY,
+        version BIGINT NOT NULL
+    )
+    """,
+    """
+    INSERT INTO datos_version (tabla, version) VALUES ('gastos', 0)
+    ON CONFLICT DO NOTHING
+    """,
+    """
+    CREATE OR REPLACE FUNCTION gastos_version_bump() RETURNS trigger AS $$
+    BEGIN
+        UPDATE datos_version SET version = version + 1
+         WHERE tabla = 'gastos';
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE TRIGGER gastos_version
+    AFTER INSERT OR UPDATE OR DELETE ON gastos
+    FOR EACH STATEMENT EXECUTE FUNCTION gastos_version_bump()
+    """,
+]
+
+# Literales entre comillas (se dejan igual), `?`, `:nombre` (no `::tipo`)
+# y `%` sueltos, que psycopg interpretaría como placeholder.
+_RE_PLACEHOLDERS = re.compile(
+    r"('(?:[^']|'')*'|\$\$.*?\$\$)|(\?)|(?<!:):([A-Za-z_]\w*)|(%)", re.S
+)
+
+
+def a_postgres(sql: str) -> str:
+    def reemplazo(m):
+        if m.group(1):
+            return m.group(1)
+        if m.group(2):
+            return "%s"
+        if m.group(3):
+            return f"%({m.group(3)})s"
+        return "%%"
+
+    return _RE_PLACEHOLDERS.sub(reemplazo, sql)
+
+
+# pg_advisory_xact_lock de las escrituras de RSVPs (ver bloquear_rsvps)
+LOCK_RSVPS = 20250602
+
+
+class Fila(tuple):
+    """Tupla que también se indexa por nombre de columna, como sqlite3.Row."""
+
+    def __new__(cls, valores, indices):
+        fila = super().__new__(cls, valores)
+        fila._indices = indices
+        return fila
+
+    def __getitem__(self, k):
+        if isinstance(k, str):
+            k = self._indices[k]
+        return super().__getitem__(k)
+
+    def keys(self):
+        return list(self._indices)
+
+
+def _fila_factory(cursor):
+    desc = cursor.description or []
+    indices = {c.name: i for i, c in enumerate(desc)}
+    return lambda valores: Fila(valores, indices)
+
+
+class ConexionPG:
+    """Envoltorio con la interfaz de sqlite3.Connection que usa app.py."""
+
+    def __init__(self, pool):
+        self._pool = pool
+        self._con = pool.getconn()
+
+    def execute(self, sql: str, params=()):
+        cur = self._con.cursor(row_factory=_fila_factory)
+        if params:
+            cur.execute(a_postgres(sql), params)
+        else:
+            # sin parámetros psycopg no interpreta `%`: va tal cual
+            cur.execute(sql)
+        return cur
+
+    def executemany(self, sql: str, seq):
+        cur = self._con.cursor(row_factory=_fila_factory)
+        cur.executemany(a_postgres(sql), list(seq))
+        return cur
+
+    def commit(self):
+        self._con.commit()
+
+    def rollback(self):
+        self._con.rollback()
+
+    def close(self):
+        # lo que no se commiteó se descarta antes de devolverla al pool
+        self._con.rollback()
+        self._pool.putconn(self._con)
+
+
+class PostgresStorage:
+    motor = "postgres"
+
+    def __init__(self, url: str):
+        if psycopg is None:
+            raise RuntimeError(
+                "DATABASE_URL apunta a Postgres pero falta psycopg. "
+                "Ejecutá: pip install 'psycopg[binary]' psycopg-pool"
+            )
+        self.url = url
+        self.nombre = f"postgres:{url.rsplit('@', 1)[-1]}"
+        self._pool = None
+        self._pid = None
+
+    @property
+    def pool(self):
+        # El pool se crea en cada worker (después del fork de gunicorn)
+        if self._pool is None or self._pid != os.getpid():
+            from psycopg_pool import ConnectionPool
+
+            self._pool = ConnectionPool(
+                self.url,
+                min_size=int(os.getenv("PG_POOL_MIN", "1")),
+                max_size=int(os.getenv("PG_POOL_MAX", "5")),
+                open=True,
+            )
+            self._pid = os.getpid()
+        return self._pool
+
+    def conectar(self):
+        return ConexionPG(self.pool)
+
+    def init_schema(self, db):
+        # Con varias máquinas arrancando juntas, que sólo una cree el schema
+        db.execute("SELECT pg_advisory_xact_lock(20250601)")
+        for sql in SCHEMA_POSTGRES:
+            db.execute(sql)
+        ahora = datetime.now().isoformat(timespec="seconds")
+        db.execute(RELLENAR_UPDATED_AT, (ahora,))
+        db.commit()
+
+    def bloquear_rsvps(self, db):
+        # Un solo lock para todas las escrituras de RSVPs (como el de SQLite):
+        # en las ediciones por id el nombre se conoce recién después de leer,
+        # y locks por nombre se pueden cruzar con los renombres en cascada.
+        db.execute("SELECT pg_advisory_xact_lock(?)", (LOCK_RSVPS,))
+
+    def stream(self, sql: str, params=(), chunk: int = 500, envolver=None):
+        # Cursor del lado del servidor: no trae todo el resultado a memoria
+        with self.pool.connection() as con:
+            with con.transaction():
+                with con.cursor(
+                    name="export_stream", row_factory=_fila_factory
+                ) as cur:
+                    cur.itersize = chunk
+                    if envolver is not None:
+                        cur = envolver(cur)
+                    if params:
+                        cur.execute(a_postgres(sql), params)
+                    else:
+                        cur.execute(sql)
+                    while True:
+                        filas = cur.fetchmany(chunk)
+                        if not filas:
+                            break
+                        yield from filas
+
+
+def crear_storage(db_path: str):
+    url = os.getenv("DATABASE_URL", "")
+    if url.startswith(("postgres://", "postgresql://")):
+        return PostgresStorage(url)
+    return SQLiteStorage(db_path)
@@ -0,0 +1,96 @@
+"""
+Los tests de la app corren contra los dos backends de storage.py.
+
+SQLite va siempre (un archivo temporal por test). Postgres corre si hay
+TEST_DATABASE_URL (en CI lo levanta el servicio de GitHub Actions); cada
+test arranca con el schema `public` vacío, así que usá una base descartable.
+"""
+import os
+import tempfile
+
+import pytest
+
+_TMP = tempfile.mkdtemp(prefix="casorio_tests_")
+os.environ.pop("DATABASE_URL", None)
+os.environ["DB_PATH"] = os.path.join(_TMP, "rsvps.db")
+os.environ["RATE_DB_PATH"] = os.path.join(_TMP, "ratelimit.db")
+os.environ["BACKUP_DIR"] = os.path.join(_TMP, "backups")
+os.environ["PROFILE_DIR"] = os.path.join(_TMP, "profiles")
+# que el limitador no se meta en los tests (tiene los suyos)
+os.environ["RATE_ENVIAR_BURST"] = "1000000"
+os.environ["RATE_API_BURST"] = "1000000"
+os.environ["SHED_MAX_COLA"] = "0"
+os.environ["SHED_MAX_ESPERA_MS"] = "0"
+
+import app as app_module  # noqa: E402
+from storage import PostgresStorage, SQLiteStorage  # noqa: E402
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL", "")
+
+
+@pytest.fixture(params=["sqlite", "postgres"])
+def storage(request, tmp_path, monkeypatch):
+    if request.param == "sqlite":
+        s = SQLiteStorage(str(tmp_path / "rsvps.db"))
+        monkeypatch.setattr(app_module, "DB_PATH", s.path)
+    else:
+        if not TEST_DATABASE_URL:
+            pytest.skip("Postgres: falta TEST_DATABASE_URL")
+        s = PostgresStorage(TEST_DATABASE_URL)
+        with s.pool.connection() as con:
+            con.execute("DROP SCHEMA public CASCADE")
+            con.execute("CREATE SCHEMA public")
+
+    monkeypatch.setattr(app_module, "storage", s)
+    monkeypatch.setattr(app_module, "_schema_listo", False)
+    app_module._escenarios_cache.clear()
+    with app_module.app.app_context():
+        app_module.init_db()
+    yield s
+
+    if request.param == "postgres":
+        s.pool.close()
+
+
+@pytest.fixture
+def client(storage):
+    return app_module.app.test_client()
+
+
+@pytest.fixture
+def key():
+    return app_module.ADMIN_KEY
+
+
+@pytest.fixture
+def sql(storage):
+    """sql("SELECT ...", params) -> filas, con una conexión aparte."""
+
+    def consultar(consulta, params=()):
+        con = storage.conectar()
+        try:
+            return [tuple(f) for f in con.execute(consulta, params).fetchall()]
+        finally:
+            con.close()
+
+    return consultar
+
+
+@pytest.fixture
+def invitados(storage):
+    """Carga invitados y devuelve {nombre: id}."""
+
+    def cargar(*nombres):
+        con = storage.conectar()
+        try:
+            ids = {}
+            for n in nombres:
+                ids[n] = con.execute(
+                    "INSERT INTO invitados (nombre) VALUES (?) RETURNING id", (n,)
+                ).fetchone()[0]
+            con.commit()
+            return ids
+        finally:
+            con.close()
+
+    return cargar
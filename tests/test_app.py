@@ -0,0 +1,530 @@
+import json
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import app as app_module
+
+
+def _rollups(sql):
+    return {
+        esc: sorted(sql(f"SELECT * FROM rsvp_rollup_{esc} ORDER BY bucket"))
+        for esc in app_module.ROLLUP_ESCALAS
+    }
+
+
+def _sin_ceros(filas):
+    return [f for f in filas if any(f[1:])]
+
+
+def _rollups_consistentes(storage, sql):
+    """Los rollups incrementales dan lo mismo que rearmarlos de cero."""
+    actuales = {k: _sin_ceros(v) for k, v in _rollups(sql).items()}
+    con = storage.conectar()
+    try:
+        app_module.rollup_reconstruir(con)
+        rearmados = {
+            esc: _sin_ceros(
+                sorted(
+                    tuple(f)
+                    for f in con.execute(
+                        f"SELECT * FROM rsvp_rollup_{esc} ORDER BY bucket"
+                    ).fetchall()
+                )
+            )
+            for esc in app_module.ROLLUP_ESCALAS
+        }
+    finally:
+        con.rollback()
+        con.close()
+    return actuales == rearmados
+
+
+# ---------- /enviar ----------
+
+
+def test_enviar_guarda_la_respuesta(client, sql, invitados, storage):
+    invitados("Ana Gómez")
+    r = client.post(
+        "/enviar",
+        data={"nombre": "Ana Gómez", "confirma": "si", "menu": "Vegano"},
+    )
+    assert r.status_code == 303
+    assert r.location.endswith("/gracias")
+    assert sql("SELECT nombre, confirma, menu FROM rsvps") == [
+        ("Ana Gómez", 1, "veggie")
+    ]
+    assert _rollups_consistentes(storage, sql)
+
+
+def test_enviar_rechaza_nombre_desconocido(client, sql, invitados):
+    invitados("Ana Gómez")
+    r = client.post(
+        "/enviar",
+        data={"nombre": "Nadie", "confirma": "no"},
+        headers={"Accept": "application/json"},
+    )
+    assert r.status_code == 400
+    assert r.json["ok"] is False
+    assert sql("SELECT COUNT(*) FROM rsvps") == [(0,)]
+
+
+def test_enviar_con_clave_repetida_guarda_una_vez(client, sql, invitados):
+    invitados("Ana Gómez")
+    datos = {
+        "nombre": "Ana Gómez",
+        "confirma": "no",
+        "idempotency_key": "clave-de-prueba-1",
+    }
+    json_ = {"Accept": "application/json"}
+    assert client.post("/enviar", data=datos, headers=json_).json == {"ok": True}
+    assert client.post("/enviar", data=datos, headers=json_).json == {
+        "ok": True,
+        "duplicado": True,
+    }
+    assert sql("SELECT COUNT(*) FROM rsvps") == [(1,)]
+
+
+def test_enviar_reenvio_viejo_no_pisa_la_respuesta_nueva(client, sql, invitados):
+    invitados("Ana Gómez")
+    json_ = {"Accept": "application/json"}
+    hace_un_rato = (
+        datetime.now(timezone.utc) - timedelta(minutes=10)
+    ).isoformat().replace("+00:00", "Z")
+
+    # contestó "si" con señal; el "no" de hace un rato estaba en la cola
+    client.post("/enviar", data={"nombre": "Ana Gómez", "confirma": "si", "menu": "standard"})
+    r = client.post(
+        "/enviar",
+        data={
+            "nombre": "Ana Gómez",
+            "confirma": "no",
+            "idempotency_key": "clave-de-prueba-2",
+            "guardado": hace_un_rato,
+        },
+        headers=json_,
+    )
+    assert r.json == {"ok": True, "descartado": True}
+    assert sql("SELECT confirma FROM rsvps") == [(1,)]
+
+    # una hecha sin conexión después de la última sí se guarda
+    r = client.post(
+        "/enviar",
+        data={
+            "nombre": "Ana Gómez",
+            "confirma": "no",
+            "idempotency_key": "clave-de-prueba-3",
+            "guardado": datetime.now(timezone.utc).isoformat(),
+        },
+        headers=json_,
+    )
+    assert r.json == {"ok": True}
+    assert sql("SELECT confirma FROM rsvps ORDER BY id") == [(1,), (0,)]
+
+
+# ---------- Admin ----------
+
+
+def test_admin_renombra_invitado_en_cascada(client, key, sql, invitados, storage):
+    ids = invitados("Ana", "Beto")
+    client.post("/enviar", data={"nombre": "Ana", "confirma": "no"})
+
+    client.post(
+        "/admin/invitado/update",
+        data={"key": key, "id": ids["Ana"], "nombre": "Ana María", "cascade": "1"},
+    )
+    assert sql("SELECT nombre FROM rsvps") == [("Ana María",)]
+
+    # nombre repetido: no rompe, avisa y no cambia nada
+    r = client.post(
+        "/admin/invitado/update",
+        data={"key": key, "id": ids["Beto"], "nombre": "Ana María"},
+    )
+    assert r.status_code == 302
+    assert sql("SELECT nombre FROM invitados ORDER BY nombre") == [
+        ("Ana María",),
+        ("Beto",),
+    ]
+    assert _rollups_consistentes(storage, sql)
+
+
+def test_admin_edita_rsvp_y_borra_invitado(client, key, sql, invitados, storage):
+    ids = invitados("Ana", "Beto")
+    client.post("/enviar", data={"nombre": "Ana", "confirma": "no"})
+    client.post("/enviar", data={"nombre": "Beto", "confirma": "no"})
+    (rid,) = sql("SELECT id FROM rsvps WHERE nombre = 'Ana'")[0]
+
+    client.post(
+        "/admin/rsvp/update",
+        data={"key": key, "id": rid, "nombre": "Ana", "confirma": "1", "menu": "standard"},
+    )
+    assert sql("SELECT confirma, menu FROM rsvps WHERE id = ?", (rid,)) == [
+        (1, "standard")
+    ]
+
+    client.post(
+        "/admin/invitado/delete",
+        data={"key": key, "id": ids["Beto"], "cascade_delete": "1"},
+    )
+    assert sql("SELECT nombre FROM invitados") == [("Ana",)]
+    assert sql("SELECT nombre FROM rsvps") == [("Ana",)]
+    assert _rollups_consistentes(storage, sql)
+
+
+def test_admin_pide_clave(client):
+    assert client.get("/admin?key=mal").status_code == 401
+    assert client.post("/admin/batch?key=mal", json={"ops": []}).status_code == 401
+
+
+# ---------- Lote ----------
+
+
+def test_batch_aplica_todo_junto(client, key, sql, invitados, storage):
+    ids = invitados("Ana")
+    r = client.post(
+        f"/admin/batch?key={key}",
+        json={
+            "ops": [
+                {"entity": "invitado", "op": "create", "nombre": "Beto"},
+                {"entity": "rsvp", "op": "create", "nombre": "Beto", "confirma": "1", "menu": "veggie"},
+                {"entity": "invitado", "op": "update", "id": ids["Ana"], "nombre": "Ana M"},
+            ]
+        },
+    )
+    assert r.status_code == 200, r.json
+    assert [c["op"] for c in r.json["changed"]] == ["create", "create", "update"]
+    assert sql("SELECT nombre FROM invitados ORDER BY nombre") == [("Ana M",), ("Beto",)]
+    assert sql("SELECT nombre, menu FROM rsvps") == [("Beto", "veggie")]
+    assert _rollups_consistentes(storage, sql)
+
+
+def test_batch_con_error_no_guarda_nada(client, key, sql, invitados):
+    ids = invitados("Ana", "Beto")
+    r = client.post(
+        f"/admin/batch?key={key}",
+        json={
+            "ops": [
+                {"entity": "invitado", "op": "update", "id": ids["Ana"], "nombre": "Ana M"},
+                {"entity": "invitado", "op": "update", "id": ids["Beto"], "nombre": "Ana M"},
+            ]
+        },
+    )
+    assert r.status_code == 400
+    assert r.json["index"] == 1
+    assert sql("SELECT nombre FROM invitados ORDER BY nombre") == [("Ana",), ("Beto",)]
+
+
+def test_batch_rechaza_cuerpo_que_no_es_objeto(client, key):
+    for cuerpo in ([{"entity": "invitado", "op": "create", "nombre": "Ana"}], "ops", 3, None):
+        r = client.post(f"/admin/batch?key={key}", json=cuerpo)
+        assert r.status_code == 400
+        assert r.json == {"ok": False, "error": "Falta la lista de cambios."}
+
+
+# ---------- Historial ----------
+
+
+def test_compactar_y_ver_historial(client, key, sql, invitados, storage):
+    invitados("Ana", "Beto")
+    for confirma in ("no", "si", "no"):
+        client.post(
+            "/enviar",
+            data={"nombre": "Ana", "confirma": confirma, "menu": "standard"},
+        )
+    client.post("/enviar", data={"nombre": "Beto", "confirma": "no"})
+
+    con = storage.conectar()
+    try:
+        assert app_module.compactar_rsvps(con) == 2
+    finally:
+        con.close()
+    assert sql("SELECT nombre FROM rsvps ORDER BY nombre") == [("Ana",), ("Beto",)]
+
+    items = client.get(f"/admin/rsvp/historial?key={key}&nombre=Ana").json["items"]
+    assert [i["archivada"] for i in items] == [True, True, False]
+    assert [i["confirma"] for i in items] == [0, 1, 0]
+    assert _rollups_consistentes(storage, sql)
+
+
+# ---------- Datos en crudo ----------
+
+
+def test_stream_ndjson(client, key, invitados):
+    invitados("Ana", "Beto", "Carla")
+    client.post("/enviar", data={"nombre": "Ana", "confirma": "no"})
+    client.post("/enviar", data={"nombre": "Ana", "confirma": "si", "menu": "veggie"})
+
+    r = client.get(f"/api/data/invitados.ndjson?key={key}")
+    assert r.mimetype == "application/x-ndjson"
+    filas = [json.loads(linea) for linea in r.data.decode().splitlines()]
+    assert [f["nombre"] for f in filas] == ["Ana", "Beto", "Carla"]
+
+    # sólo la respuesta vigente de cada invitado
+    r = client.get(f"/api/data/rsvps.ndjson?key={key}")
+    rsvps = [json.loads(x) for x in r.data.decode().splitlines()]
+    assert [(f["nombre"], f["confirma"]) for f in rsvps] == [("Ana", 1)]
+
+
+def _envejecer(storage):
+    """Lleva todo lo cargado hasta ahora al año 2000."""
+    con = storage.conectar()
+    try:
+        for tabla in ("invitados", "rsvps", "gastos"):
+            con.execute(f"UPDATE {tabla} SET updated_at = '2000-01-01T00:00:00'")
+        con.commit()
+    finally:
+        con.close()
+
+
+def _lineas(r):
+    return [json.loads(x) for x in r.data.decode().splitlines()]
+
+
+def test_stream_since_trae_ediciones_y_borrados(client, key, sql, invitados, storage):
+    ids = invitados("Ana", "Beto", "Carla", "Dani")
+    for nombre in ("Ana", "Beto", "Dani"):
+        client.post("/enviar", data={"nombre": nombre, "confirma": "no"})
+    for concepto in ("Salón", "Torta"):
+        client.post(
+            "/gastos/agregar", data={"concepto": concepto, "tipo": "total", "monto": "10"}
+        )
+    rsvp = dict(sql("SELECT nombre, id FROM rsvps"))
+    gasto = dict(sql("SELECT concepto, id FROM gastos"))
+    _envejecer(storage)
+    since = "2001-01-01T00:00:00"
+
+    # nada cambió desde entonces
+    for dataset in ("invitados", "rsvps", "gastos"):
+        r = client.get(f"/api/data/{dataset}.ndjson?key={key}&since={since}")
+        assert r.data == b""
+
+    client.post("/enviar", data={"nombre": "Ana", "confirma": "si", "menu": "veggie"})
+    client.post(
+        "/admin/rsvp/update",
+        data={"key": key, "id": rsvp["Beto"], "nombre": "Beto", "confirma": "1",
+              "menu": "standard"},
+    )
+    client.post(
+        "/admin/invitado/update", data={"key": key, "id": ids["Carla"], "nombre": "Carolina"}
+    )
+    client.post(
+        "/admin/invitado/delete",
+        data={"key": key, "id": ids["Dani"], "cascade_delete": "1"},
+    )
+    client.post(
+        "/gastos/editar",
+        data={"id": gasto["Salón"], "concepto": "Salón", "tipo": "total", "monto": "20"},
+    )
+    client.post(f"/gastos/borrar/{gasto['Torta']}")
+
+    filas = _lineas(client.get(f"/api/data/invitados.ndjson?key={key}&since={since}"))
+    assert [(f["id"], f["nombre"], f["_borrado"]) for f in filas] == [
+        (ids["Carla"], "Carolina", 0),
+        (ids["Dani"], None, 1),
+    ]
+
+    filas = _lineas(client.get(f"/api/data/rsvps.ndjson?key={key}&since={since}"))
+    (ana,) = [f["id"] for f in filas if f["nombre"] == "Ana"]
+    assert sorted((f["id"], f["confirma"], f["_borrado"]) for f in filas) == sorted(
+        [
+            (ana, 1, 0),
+            (rsvp["Beto"], 1, 0),
+            (rsvp["Ana"], None, 1),  # la reemplazó la respuesta nueva
+            (rsvp["Dani"], None, 1),
+        ]
+    )
+    assert all(f["updated_at"] >= since for f in filas)
+
+    filas = _lineas(client.get(f"/api/data/gastos.ndjson?key={key}&since={since}"))
+    assert [(f["id"], f["monto_cent"], f["_borrado"]) for f in filas] == [
+        (gasto["Salón"], 2000, 0),
+        (gasto["Torta"], None, 1),
+    ]
+
+
+def test_stream_since_rsvp_que_vuelve_a_ser_vigente(client, key, sql, invitados, storage):
+    invitados("Ana")
+    client.post("/enviar", data={"nombre": "Ana", "confirma": "no"})
+    client.post("/enviar", data={"nombre": "Ana", "confirma": "si", "menu": "veggie"})
+    (vieja,), (nueva,) = sql("SELECT id FROM rsvps ORDER BY id")
+    _envejecer(storage)
+
+    # al borrar la vigente, la anterior vuelve al dataset (y deja de estar borrada)
+    client.post(
+        f"/admin/batch?key={key}",
+        json={"ops": [{"entity": "rsvp", "op": "delete", "id": nueva}]},
+    )
+    r = client.get(f"/api/data/rsvps.csv?key={key}&since=2001-01-01T00:00:00")
+    filas = r.data.decode().splitlines()
+    assert filas[0] == "id,nombre,confirma,menu,mensaje,created_at,updated_at,_borrado"
+    assert [(f.split(",")[0], f.split(",")[-1]) for f in filas[1:]] == [
+        (str(vieja), "0"),
+        (str(nueva), "1"),
+    ]
+    assert sql("SELECT fila_id FROM borrados WHERE tabla = 'rsvps'") == [(nueva,)]
+
+
+def test_stream_since_tiene_que_ser_una_fecha(client, key, invitados, storage):
+    invitados("Ana")
+    _envejecer(storage)
+    for malo in ("garbage", "2001-13-01", "ayer"):
+        r = client.get(f"/api/data/invitados.ndjson?key={key}&since={malo}")
+        assert r.status_code == 400
+        assert r.get_json()["ok"] is False
+
+    # sólo el día, o con zona (se pasa a la hora local del server)
+    for bueno in ("1999-12-31", "1999-12-31T12:00:00Z", "1999-12-31T12:00:00%2B03:00"):
+        r = client.get(f"/api/data/invitados.ndjson?key={key}&since={bueno}")
+        assert [f["nombre"] for f in _lineas(r)] == ["Ana"]
+
+
+def test_init_rellena_updated_at_de_invitados_viejos(client, key, sql, storage):
+    """Los invitados de antes de la columna tienen que salir con since."""
+    con = storage.conectar()
+    try:
+        con.execute("INSERT INTO invitados (nombre) VALUES (?)", ("Ana",))
+        con.commit()
+        storage.init_schema(con)
+    finally:
+        con.close()
+    ((updated_at,),) = sql("SELECT updated_at FROM invitados")
+    assert updated_at is not None
+
+    r = client.get(f"/api/data/invitados.ndjson?key={key}&since={updated_at}")
+    assert [f["nombre"] for f in _lineas(r)] == ["Ana"]
+
+
+def test_stream_csv_con_gzip(client, key, invitados):
+    import gzip
+
+    invitados("Ana")
+    r = client.get(
+        f"/api/data/invitados.csv?key={key}", headers={"Accept-Encoding": "gzip"}
+    )
+    assert r.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(r.data).decode().splitlines() == ["id,nombre,updated_at", "1,Ana,"]
+
+
+# ---------- Gastos ----------
+
+
+def test_gastos_suma_en_centavos(client, storage, invitados):
+    invitados("Ana", "Beto", "Carla")
+    for concepto, tipo, monto in [
+        ("Salón", "total", "150.000"),
+        ("Menú", "por_invitado", "12.345,67"),
+        ("Torta", "total", "0,10"),
+        ("Bebida", "por_invitado", "0,20"),
+    ]:
+        client.post(
+            "/gastos/agregar",
+            data={"concepto": concepto, "tipo": tipo, "monto": monto},
+        )
+
+    con = storage.conectar()
+    try:
+        _, por_inv, totales, gran, costo = app_module.get_gastos_calc(con, 3)
+    finally:
+        con.close()
+    assert por_inv == Decimal("37037.61")
+    assert totales == Decimal("150000.10")
+    assert gran == Decimal("187037.71")
+    assert costo == Decimal("62345.90")
+
+    datos = client.get("/gastos/escenarios.json?desde=1&hasta=3").json
+    assert datos["gran_total_cent"] == [16234597, 17469184, 18703771]
+    assert datos["costo_por_invitado_cent"] == [16234597, 8734592, 6234590]
+
+    assert client.get("/gastos?base=manual&n=3").status_code == 200
+    assert client.get("/gastos/export.xlsx").status_code == 200
+
+
+# ---------- Exportaciones ----------
+
+
+def test_exportaciones_xlsx(client, key, invitados):
+    import io
+
+    from openpyxl import load_workbook
+
+    invitados("Ana", "Beto")
+    client.post("/enviar", data={"nombre": "Ana", "confirma": "si", "menu": "veggie"})
+    client.post(
+        "/gastos/agregar",
+        data={"concepto": "Menú", "tipo": "por_invitado", "monto": "100"},
+    )
+
+    wb = load_workbook(io.BytesIO(client.get(f"/admin/export.xlsx?key={key}").data))
+    resp = list(wb["Respondieron"].iter_rows(values_only=True))
+    assert resp[0][0] == "nombre"
+    assert resp[1][:3] == ("Ana", "si", "veggie")
+    assert list(wb["Faltan"].iter_rows(values_only=True)) == [("nombre",), ("Beto",)]
+
+    wb = load_workbook(io.BytesIO(client.get("/gastos/export.xlsx").data))
+    gastos = list(wb["Gastos"].iter_rows(values_only=True))
+    assert gastos[1][1:6] == ("Menú", "por_invitado", 100, 2, 200)
+    resumen = dict(wb["Resumen"].iter_rows(values_only=True))
+    assert resumen["Gran total"] == 200
+
+
+# ---------- Rollups con escrituras concurrentes ----------
+
+
+def test_rollups_con_dos_escrituras_a_la_vez(client, sql, invitados, storage):
+    """
+    Mientras una escritura tiene leído el historial de un invitado (y todavía
+    no commiteó), otra para el mismo invitado tiene que esperar: si leyera el
+    mismo historial, su aporte a los rollups se contaría dos veces.
+    """
+    import threading
+    import time
+    from datetime import datetime
+
+    invitados("Ana")
+    client.post("/enviar", data={"nombre": "Ana", "confirma": "no"})
+
+    # Escritura 1, a mano, como la hacen las rutas
+    con = storage.conectar()
+    storage.bloquear_rsvps(con)
+    app_module.rollup_aplicar(con, ["Ana"], -1)
+
+    # Escritura 2, por HTTP, en paralelo
+    resultado = {}
+    hilo = threading.Thread(
+        target=lambda: resultado.setdefault(
+            "r",
+            client.post(
+                "/enviar", data={"nombre": "Ana", "confirma": "si", "menu": "veggie"}
+            ),
+        )
+    )
+    hilo.start()
+    time.sleep(0.3)
+    assert hilo.is_alive(), "la segunda escritura no esperó el lock"
+
+    con.execute(
+        "INSERT INTO rsvps (nombre, confirma, menu, mensaje, created_at) "
+        "VALUES ('Ana', 1, 'standard', NULL, ?)",
+        (datetime.now().isoformat(timespec="seconds"),),
+    )
+    app_module.rollup_aplicar(con, ["Ana"], 1)
+    con.commit()
+    con.close()
+
+    hilo.join(10)
+    assert resultado["r"].status_code == 303
+    assert sql("SELECT COUNT(*) FROM rsvps") == [(3,)]
+    assert _rollups_consistentes(storage, sql)
+
+
+def test_rollups_pendientes_sobre_la_lista_actual(client, key, invitados):
+    invitados("Ana", "Beto", "Carla")
+    client.post("/enviar", data={"nombre": "Ana", "confirma": "no"})
+    invitados("Dani")  # alta después de la respuesta
+
+    data = client.get(f"/admin/rollups.json?key={key}&escala=dia").get_json()
+    assert data["invitados"] == 4
+    assert data["pendientes_nota"] == app_module.PENDIENTES_NOTA
+    # el bucket de la respuesta ya cuenta a Dani: 4 invitados - 1 respuesta
+    (bucket,) = data["buckets"]
+    assert bucket["pendientes"] == -1
+    assert bucket["pendientes_acum"] == 3
@@ -0,0 +1,128 @@
+import json
+import sqlite3
+
+import pytest
+
+import backups
+
+A = "rsvps_20261019_120000.db"  # lunes, semana 43
+B = "rsvps_20261019_080000.db"
+C = "rsvps_20261018_230000.db"  # domingo, semana 42
+D = "rsvps_20261018_070000.db"
+E = "rsvps_20261012_090000.db"  # lunes, semana 42
+F = "rsvps_20261005_090000.db"  # semana 41
+NOMBRES = [D, F, A, C, E, B]  # el orden de entrada no importa
+
+
+@pytest.mark.parametrize(
+    "ultimos, diarios, semanales, quedan",
+    [
+        (3, 0, 0, {A, B, C}),
+        (0, 4, 0, {A, C, E, F}),  # el último de cada día
+        (0, 0, 3, {A, C, F}),  # el último de cada semana
+        (1, 2, 2, {A, C}),
+        (0, 0, 0, set()),
+    ],
+)
+def test_a_conservar(ultimos, diarios, semanales, quedan):
+    assert backups.a_conservar(NOMBRES, ultimos, diarios, semanales) == quedan
+
+
+def test_podar_borra_los_que_no_quedan(tmp_path):
+    for n in NOMBRES:
+        (tmp_path / n).write_bytes(b"")
+        (tmp_path / n.replace(".db", ".meta.json")).write_text("{}")
+    borrados = backups.podar(str(tmp_path), 1, 2, 2)
+    assert sorted(borrados) == sorted({B, D, E, F})
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted(
+        [A, C, A.replace(".db", ".meta.json"), C.replace(".db", ".meta.json")]
+    )
+
+
+@pytest.fixture
+def base(tmp_path):
+    path = tmp_path / "rsvps.db"
+    con = sqlite3.connect(path)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("CREATE TABLE rsvps (id INTEGER PRIMARY KEY, nombre TEXT)")
+    con.executemany(
+        "INSERT INTO rsvps (nombre) VALUES (?)", [(f"n{i}",) for i in range(50)]
+    )
+    con.commit()
+    con.close()
+    return str(path)
+
+
+@pytest.fixture
+def snapshot(base, tmp_path):
+    carpeta = str(tmp_path / "backups")
+    meta = backups.hacer_backup(base, carpeta, paginas=1, pausa=0)
+    return carpeta, meta
+
+
+def _meta(carpeta, nombre):
+    return f"{carpeta}/{nombre[: -len('.db')]}.meta.json"
+
+
+def test_hacer_backup_anota_filas_y_no_repite(base, snapshot):
+    carpeta, meta = snapshot
+    assert meta["filas"] == {"rsvps": 50}
+    assert backups.verificar(carpeta, meta["archivo"]) is None
+
+    # la base no cambió: no se guarda otro igual
+    otra = backups.hacer_backup(base, carpeta, pausa=0)
+    assert otra["sin_cambios"] is True
+    assert [m["archivo"] for m in backups.listar(carpeta)] == [meta["archivo"]]
+
+
+def test_verificar_detecta_archivo_modificado(snapshot):
+    carpeta, meta = snapshot
+    with open(f"{carpeta}/{meta['archivo']}", "ab") as f:
+        f.write(b"\0")
+    assert backups.verificar(carpeta, meta["archivo"]).startswith("sha256 distinto")
+
+
+def test_verificar_detecta_filas_distintas(snapshot):
+    carpeta, meta = snapshot
+    # sin sha256 en la meta, queda sólo la cuenta de filas
+    otra = {**meta, "filas": {"rsvps": 49, "gastos": 3}}
+    del otra["sha256"]
+    with open(_meta(carpeta, meta["archivo"]), "w") as f:
+        json.dump(otra, f)
+    assert backups.verificar(carpeta, meta["archivo"]) == (
+        "filas distintas en gastos, rsvps"
+    )
+
+
+def test_verificar_nombre_invalido(snapshot):
+    carpeta, _ = snapshot
+    assert backups.verificar(carpeta, "../rsvps.db") == "no existe"
+
+
+def test_restaurar_copia_y_verifica(snapshot, tmp_path):
+    carpeta, meta = snapshot
+    destino = str(tmp_path / "restaurada.db")
+    restaurada = backups.restaurar(carpeta, meta["archivo"], destino)
+    assert restaurada["filas"] == meta["filas"]
+    con = sqlite3.connect(destino)
+    assert con.execute("SELECT COUNT(*) FROM rsvps").fetchone()[0] == 50
+    con.close()
+
+
+def test_restaurar_no_pisa_un_archivo_existente(snapshot, base):
+    carpeta, meta = snapshot
+    with pytest.raises(RuntimeError, match="ya existe"):
+        backups.restaurar(carpeta, meta["archivo"], base)
+    con = sqlite3.connect(base)
+    assert con.execute("SELECT COUNT(*) FROM rsvps").fetchone()[0] == 50
+    con.close()
+
+
+def test_restaurar_rechaza_un_snapshot_que_no_verifica(snapshot, tmp_path):
+    carpeta, meta = snapshot
+    with open(f"{carpeta}/{meta['archivo']}", "ab") as f:
+        f.write(b"\0")
+    destino = tmp_path / "restaurada.db"
+    with pytest.raises(RuntimeError, match="sha256"):
+        backups.restaurar(carpeta, meta["archivo"], str(destino))
+    assert not destino.exists()
@@ -0,0 +1,82 @@
+import io
+from decimal import Decimal
+
+import pytest
+
+import app as app_module
+
+
+@pytest.mark.parametrize(
+    "texto, cent",
+    [
+        ("12.34", 1234),
+        ("12,34", 1234),
+        ("12.345,67", 1234567),
+        ("1,234.50", 123450),
+        ("12345", 1234500),
+        ("15.000", 1500000),
+        ("1,234", 123400),  # un separador + 3 dígitos es de miles
+        ("$ 1.500", 150000),
+        (",5", 50),
+        ("-3", -300),
+    ],
+)
+def test_parse_monto_cent(texto, cent):
+    assert app_module.parse_monto_cent(texto) == cent
+
+
+@pytest.mark.parametrize(
+    "texto", ["", "-", "+", ",", ".", "$", "-,", "abc", "1.2.3,456", "1,2345"]
+)
+def test_parse_monto_cent_invalido(texto):
+    with pytest.raises(ValueError):
+        app_module.parse_monto_cent(texto)
+
+
+@pytest.mark.parametrize(
+    "valor, cent",
+    [
+        (2.125 * 1000, 212500),
+        (2.5, 250),
+        (15000, 1500000),
+        (Decimal("12.34"), 1234),
+        (0.1, 10),
+        ("2.125", 212500),  # texto: '.' + 3 dígitos es separador de miles
+    ],
+)
+def test_monto_celda_cent(valor, cent):
+    assert app_module.monto_celda_cent(valor) == cent
+
+
+@pytest.mark.parametrize("valor", [2.125, 0.001, float("nan"), True, None])
+def test_monto_celda_cent_invalido(valor):
+    with pytest.raises(ValueError):
+        app_module.monto_celda_cent(valor)
+
+
+def test_importar_xlsx_con_celdas_numericas(client, sql):
+    from openpyxl import Workbook
+
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["concepto", "tipo", "monto", "notas"])
+    ws.append(["Flores", "total", 2.5, None])
+    ws.append(["Souvenirs", "por invitado", 2.125, None])  # 3 decimales
+    ws.append(["DJ", "total", "150.000", "texto"])
+    ws.append(["Torta", "total", 15000, None])
+    bio = io.BytesIO()
+    wb.save(bio)
+    bio.seek(0)
+
+    r = client.post(
+        "/gastos/importar",
+        data={"archivo": (bio, "gastos.xlsx")},
+        content_type="multipart/form-data",
+        follow_redirects=True,
+    )
+    assert "Fila 3: Monto con más de 2 decimales" in r.data.decode()
+    assert sql("SELECT concepto, monto_cent FROM gastos ORDER BY id") == [
+        ("Flores", 250),
+        ("DJ", 15000000),
+        ("Torta", 1500000),
+    ]
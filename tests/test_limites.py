@@ -0,0 +1,150 @@
+import socket
+import threading
+import time
+
+import pytest
+
+import app as app_module
+
+
+def test_cola_accept_cuenta_las_conexiones_sin_atender():
+    srv = socket.socket()
+    srv.bind(("127.0.0.1", 0))
+    srv.listen(16)
+    puerto = srv.getsockname()[1]
+    clientes = []
+    try:
+        if app_module.cola_accept(puerto) is None:
+            pytest.skip("sin /proc/net/tcp")
+        assert app_module.cola_accept(puerto) == 0
+        for _ in range(3):
+            c = socket.create_connection(("127.0.0.1", puerto))
+            clientes.append(c)
+        time.sleep(0.05)
+        assert app_module.cola_accept(puerto) == 3
+    finally:
+        for c in clientes:
+            c.close()
+        srv.close()
+
+
+@pytest.mark.parametrize("valor", [None, "", "cualquiera"])
+def test_espera_previa_sin_dato(valor):
+    assert app_module.espera_previa_ms(valor) is None
+
+
+@pytest.mark.parametrize(
+    "formato, escala",
+    [
+        ("t={:.0f}", 1e3),  # ms, como nginx/heroku
+        ("t={:.3f}", 1),  # segundos con decimales
+        ("{:.0f}", 1e6),  # µs, sin prefijo
+    ],
+)
+def test_espera_previa(formato, escala):
+    valor = formato.format((time.time() - 2) * escala)
+    assert app_module.espera_previa_ms(valor) == pytest.approx(2000, abs=100)
+
+
+def test_reloj_del_proxy_adelantado_no_da_negativo():
+    assert app_module.espera_previa_ms(f"t={(time.time() + 5) * 1000:.0f}") == 0
+
+
+def test_descarta_si_el_pedido_espero_demasiado(client, monkeypatch):
+    monkeypatch.setattr(app_module, "SHED_MAX_ESPERA_MS", 1000)
+    viejo = f"t={(time.time() - 3) * 1000:.0f}"
+    r = client.get("/api/invitados?q=abcd", headers={"X-Request-Start": viejo})
+    assert r.status_code == 503
+    assert r.headers["Retry-After"] == "1"
+
+    reciente = f"t={time.time() * 1000:.0f}"
+    r = client.get("/api/invitados?q=abcd", headers={"X-Request-Start": reciente})
+    assert r.status_code == 200
+
+
+def test_descarta_con_la_cola_llena(client, monkeypatch):
+    monkeypatch.setattr(app_module, "SHED_MAX_COLA", 2)
+    monkeypatch.setattr(app_module, "cola_accept", lambda: 2)
+    assert client.get("/api/invitados?q=abcd").status_code == 503
+    monkeypatch.setattr(app_module, "cola_accept", lambda: 1)
+    assert client.get("/api/invitados?q=abcd").status_code == 200
+    # fuera de Linux no se sabe: se atiende
+    monkeypatch.setattr(app_module, "cola_accept", lambda: None)
+    assert client.get("/api/invitados?q=abcd").status_code == 200
+
+
+@pytest.fixture
+def limitado(client, tmp_path, monkeypatch):
+    """Buckets en una base nueva y límites chicos para llegar al 429."""
+    monkeypatch.setattr(app_module, "RATE_DB_PATH", str(tmp_path / "rate.db"))
+    monkeypatch.setattr(app_module, "_rate_local", threading.local())
+    monkeypatch.setattr(
+        app_module,
+        "RATE_LIMITS",
+        {"api_invitados": (2, 0.5), "enviar_rsvp": (1, 1 / 60)},
+    )
+    return client
+
+
+def _buscar(client, ip):
+    return client.get("/api/invitados?q=abcd", headers={"Fly-Client-IP": ip})
+
+
+def test_limita_por_ip_y_por_ruta(limitado, key):
+    assert _buscar(limitado, "10.0.0.1").status_code == 200
+    assert _buscar(limitado, "10.0.0.1").status_code == 200
+    r = _buscar(limitado, "10.0.0.1")
+    assert r.status_code == 429
+    assert r.get_json()["ok"] is False
+    # burst 2 a 0,5 tokens/s: falta un token entero, 2 segundos
+    assert r.headers["Retry-After"] == "2"
+
+    # otra IP tiene su propio bucket
+    assert _buscar(limitado, "10.0.0.2").status_code == 200
+    # y la misma IP, en otra ruta, también
+    r = limitado.post(
+        "/enviar", data={"nombre": "Nadie"}, headers={"Fly-Client-IP": "10.0.0.1"}
+    )
+    assert r.status_code != 429
+    r = limitado.post(
+        "/enviar", data={"nombre": "Nadie"}, headers={"Fly-Client-IP": "10.0.0.1"}
+    )
+    assert r.status_code == 429
+    assert r.headers["Retry-After"] == "60"
+
+    contadores = limitado.get(f"/admin/limites.json?key={key}").get_json()[
+        "contadores"
+    ]
+    assert contadores["admitidos:api_invitados"] == 3
+    assert contadores["limitados:api_invitados"] == 1
+    assert contadores["admitidos:enviar_rsvp"] == 1
+    assert contadores["limitados:enviar_rsvp"] == 1
+
+
+def test_x_forwarded_for_inventado_no_da_bucket_nuevo(limitado):
+    for falsa in ("1.1.1.1", "2.2.2.2"):
+        r = limitado.get(
+            "/api/invitados?q=abcd",
+            headers={"X-Forwarded-For": f"{falsa}, 10.0.0.9"},
+        )
+        assert r.status_code == 200
+    r = limitado.get(
+        "/api/invitados?q=abcd", headers={"X-Forwarded-For": "3.3.3.3, 10.0.0.9"}
+    )
+    assert r.status_code == 429
+
+
+@pytest.mark.parametrize(
+    "headers, ip",
+    [
+        ({"Fly-Client-IP": "10.0.0.1", "X-Forwarded-For": "1.1.1.1"}, "10.0.0.1"),
+        ({"X-Forwarded-For": "1.1.1.1, 10.0.0.2"}, "10.0.0.2"),
+        ({"X-Forwarded-For": "10.0.0.3"}, "10.0.0.3"),
+        ({}, "127.0.0.1"),
+    ],
+)
+def test_client_ip(headers, ip):
+    with app_module.app.test_request_context(
+        "/", headers=headers, environ_base={"REMOTE_ADDR": "127.0.0.1"}
+    ):
+        assert app_module.client_ip() == ip
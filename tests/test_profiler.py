@@ -0,0 +1,93 @@
+import json
+import os
+
+import pytest
+
+import app as app_module
+import profiler
+
+
+def _perfil_de_prueba():
+    p = profiler.Perfil("GET", "/admin", 0.001)
+    a = ("vista", "/srv/app.py", 10)
+    b = ("consulta", "/srv/storage.py", 20)
+    p.inicio = 0.0
+    p.muestras = [(0.001, (a,)), (0.003, (a, b)), (0.004, (a, b))]
+    p.duracion = 0.004
+    return p
+
+
+def test_speedscope_deduplica_frames_y_pesa_por_intervalo():
+    s = _perfil_de_prueba().speedscope()
+    assert s["shared"]["frames"] == [
+        {"name": "vista", "file": "/srv/app.py", "line": 10},
+        {"name": "consulta", "file": "/srv/storage.py", "line": 20},
+    ]
+    (prof,) = s["profiles"]
+    assert prof["type"] == "sampled"
+    assert prof["name"] == "GET /admin"
+    assert prof["samples"] == [[0], [0, 1], [0, 1]]
+    assert prof["weights"] == pytest.approx([0.001, 0.002, 0.001])
+    assert prof["endValue"] == pytest.approx(0.004)
+
+
+def test_a_folded_acumula_pilas_en_microsegundos():
+    folded = profiler.a_folded(_perfil_de_prueba().speedscope())
+    assert folded.splitlines() == [
+        "vista (app.py) 1000",
+        "vista (app.py);consulta (storage.py) 3000",
+    ]
+
+
+def test_ruta_segura(tmp_path):
+    carpeta = str(tmp_path)
+    nombre = "20260101_000000_1_GET_admin_5ms.speedscope.json"
+    assert profiler.ruta_segura(carpeta, nombre) is None  # no existe
+    (tmp_path / nombre).write_text("{}")
+    (tmp_path / "otro.json").write_text("{}")
+
+    assert profiler.ruta_segura(carpeta, nombre) == os.path.join(carpeta, nombre)
+    for malo in ["", None, "otro.json", "../" + nombre, "x/" + nombre]:
+        assert profiler.ruta_segura(carpeta, malo) is None
+
+
+def _perfiles(carpeta):
+    return profiler.listar(str(carpeta))
+
+
+def test_profile_sin_key_no_perfila(client, key, tmp_path, monkeypatch):
+    monkeypatch.setattr(app_module, "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(app_module, "PROFILE_SAMPLE_RATE", 0.0)
+
+    assert client.get("/?profile=1").status_code == 200
+    assert client.get("/?profile=1&key=mal").status_code == 200
+    assert _perfiles(tmp_path) == []
+
+    assert client.get(f"/?profile=1&key={key}").status_code == 200
+    (meta,) = _perfiles(tmp_path)
+    assert meta["ruta"] == "/"
+
+
+def test_exports_xlsx_miden_las_consultas_del_stream(
+    client, key, invitados, tmp_path, monkeypatch
+):
+    monkeypatch.setattr(app_module, "PROFILE_DIR", str(tmp_path))
+    invitados("Ana", "Beto")
+
+    r = client.get(f"/admin/export.xlsx?key={key}&profile=1")
+    assert r.status_code == 200
+    r = client.get(f"/gastos/export.xlsx?key={key}&profile=1")
+    assert r.status_code == 200
+
+    metas = {m["ruta"]: m for m in _perfiles(tmp_path)}
+    admin = metas["/admin/export.xlsx"]
+    assert admin["sql_consultas"] > 0
+    assert any("i.nombre" in q["sql"] and q["cantidad"] == 1 for q in admin["sql"])
+
+    gastos = " ".join(app_module.SQL_GASTOS_FILAS.split())
+    medidas = metas["/gastos/export.xlsx"]["sql"]
+    assert [q["cantidad"] for q in medidas if q["sql"] == gastos] == [1]
+
+    # el speedscope guardado es JSON válido
+    with open(tmp_path / metas["/gastos/export.xlsx"]["archivo"]) as f:
+        assert json.load(f)["profiles"][0]["name"] == "GET /gastos/export.xlsx"
@@ -0,0 +1,25 @@
+import pytest
+
+from storage import a_postgres
+
+
+@pytest.mark.parametrize(
+    "sqlite, postgres",
+    [
+        ("SELECT * FROM t WHERE id = ?", "SELECT * FROM t WHERE id = %s"),
+        ("VALUES (?, ?, ?)", "VALUES (%s, %s, %s)"),
+        ("monto_cent * :n", "monto_cent * %(n)s"),
+        # los casts de Postgres no son placeholders
+        ("SELECT x::int FROM t WHERE a = :a", "SELECT x::int FROM t WHERE a = %(a)s"),
+        # dentro de comillas no se toca nada
+        ("WHERE nombre = 'a?b:c' AND id = ?", "WHERE nombre = 'a?b:c' AND id = %s"),
+        ("WHERE n = 'It''s ?' AND id = ?", "WHERE n = 'It''s ?' AND id = %s"),
+        # `%` sueltos se escapan (LIKE armado en SQL)
+        ("WHERE n LIKE '%' || ? || '%'", "WHERE n LIKE '%' || %s || '%'"),
+        ("SELECT 10 % 3, ?", "SELECT 10 %% 3, %s"),
+        # cuerpos de funciones plpgsql
+        ("AS $$ BEGIN x := ?; END $$", "AS $$ BEGIN x := ?; END $$"),
+    ],
+)
+def test_a_postgres(sqlite, postgres):
+    assert a_postgres(sqlite) == postgres